@@ -1,16 +1,210 @@
 # medications/admin.py
 
+import json
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 from .models import (
     ChemicalComposition,
     BNFHierarchy,
+    BNFHierarchyVersion,
     MedicationProduct,
     MedicationPricingHistory,
+    ImportJob,
     # CostEffectivenessAppraisal # <--- REMOVE THIS LINE
 )
+from .data_version import get_data_version
+from .jobs import enqueue_import, with_live_progress
+
+
+# --- Shared building blocks for large tables ---
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts the PostgreSQL planner's row estimate instead of running COUNT(*).
+
+    Small results (below EXACT_COUNT_THRESHOLD) and other backends still get an exact count,
+    so page links only become approximate on tables where an exact count would be slow.
+    """
+    EXACT_COUNT_THRESHOLD = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= self.EXACT_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings that keep every page constant-time regardless of table size."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skips the second, unfiltered COUNT(*)
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields are matched with a case-sensitive prefix (LIKE 'term%') so the btree
+        # index on each field can be used, instead of the default UPPER(...) LIKE '%term%' scan
+        search_term = search_term.strip()
+        search_fields = self.get_search_fields(request)
+        if not search_term or not search_fields:
+            return queryset, False
+        condition = Q()
+        for field in search_fields:
+            condition |= Q(**{f"{field}__startswith": search_term})
+        return queryset.filter(condition), False
+
+
+class CachedDistinctValuesFilter(admin.SimpleListFilter):
+    """List filter whose choices come from a DISTINCT query cached per data version.
+
+    Django's default filter re-runs SELECT DISTINCT over the whole table on every changelist load.
+    """
+    field_name = None
+    label_field = None
+
+    def lookups(self, request, model_admin):
+        cache_key = f"medications:admin_filter:v{get_data_version()}:{model_admin.model._meta.label_lower}:{self.field_name}"
+        choices = cache.get(cache_key)
+        if choices is None:
+            label_field = self.label_field or self.field_name
+            rows = (
+                model_admin.model.objects
+                .exclude(**{f"{self.field_name}__isnull": True})
+                .order_by(self.field_name)
+                .values_list(self.field_name, label_field)
+                .distinct()
+            )
+            choices = [(value, f"{value} - {label}" if self.label_field else value) for value, label in rows]
+            cache.set(cache_key, choices, 60 * 60)
+        return choices
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_name: self.value()})
+        return queryset
+
+
+class PricingSourceFilter(CachedDistinctValuesFilter):
+    title = 'source'
+    parameter_name = 'source'
+    field_name = 'source'
+
+
+class BNFChapterFilter(CachedDistinctValuesFilter):
+    title = 'BNF chapter'
+    parameter_name = 'chapter'
+    field_name = 'bnf_chapter_code'
+    label_field = 'bnf_chapter_name'
+
+
+# --- Model admins ---
+@admin.register(ChemicalComposition)
+class ChemicalCompositionAdmin(LargeTableAdmin):
+    list_display = ('chemical_name', 'chemical_description')
+    search_fields = ('chemical_name',)
+    search_help_text = 'Case-sensitive prefix match on chemical name.'
+    ordering = ('chemical_name',)
+
+
+@admin.register(BNFHierarchy)
+class BNFHierarchyAdmin(LargeTableAdmin):
+    list_display = ('bnf_code_15digit', 'bnf_presentation_description', 'bnf_chapter_name', 'bnf_version', 'valid_to_date')
+    list_filter = (BNFChapterFilter,)
+    search_fields = ('bnf_code_15digit', 'bnf_presentation_description')
+    search_help_text = 'Case-sensitive prefix match on BNF code or presentation.'
+    ordering = ('bnf_code_15digit',)
+
+
+@admin.register(BNFHierarchyVersion)
+class BNFHierarchyVersionAdmin(LargeTableAdmin):
+    list_display = ('bnf_code_15digit', 'bnf_presentation_description', 'bnf_version', 'valid_from_date', 'valid_to_date')
+    search_fields = ('bnf_code_15digit',)
+    search_help_text = 'Case-sensitive prefix match on BNF code.'
+    ordering = ('bnf_code_15digit', 'valid_from_date')
+
+    def has_add_permission(self, request):
+        return False  # Versions are written by the BNF import only
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MedicationProduct)
+class MedicationProductAdmin(LargeTableAdmin):
+    list_display = ('product_name', 'npc_code', 'bnf_code_15digit', 'chemical_name', 'latest_average_price_gbp')
+    list_select_related = ('bnf_code_15digit', 'chemical_name')
+    autocomplete_fields = ('bnf_code_15digit', 'chemical_name')
+    search_fields = ('npc_code', 'product_name')
+    search_help_text = 'Case-sensitive prefix match on NPC code or product name.'
+    ordering = ('product_name',)
+
+
+@admin.register(MedicationPricingHistory)
+class MedicationPricingHistoryAdmin(LargeTableAdmin):
+    list_display = ('product', 'source', 'price_gbp', 'period_start', 'period_end', 'usage_estimate')
+    list_select_related = ('product',)  # __str__ and the product column would otherwise query per row
+    list_filter = (PricingSourceFilter, 'period_start')
+    raw_id_fields = ('product',)
+    search_fields = ('product__npc_code',)
+    search_help_text = 'Case-sensitive prefix match on the product NPC code.'
+
+
+# admin.site.register(CostEffectivenessAppraisal) # <--- REMOVE THIS LINE
+
+
+class ImportJobChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Running jobs report progress outside their row on SQLite
+        self.result_list = [with_live_progress(job) for job in self.result_list]
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source', 'status', 'stage', 'progress', 'rows_per_second', 'eta', 'created_at', 'finished_at')
+    list_filter = ('status', 'source')
+    readonly_fields = (
+        'status', 'stage', 'processed_rows', 'total_rows', 'progress', 'rows_per_second', 'eta',
+        'worker', 'error', 'created_at', 'started_at', 'finished_at', 'heartbeat_at',
+    )
+    actions = ['queue_again']
+
+    def get_changelist(self, request, **kwargs):
+        return ImportJobChangeList
+
+    def get_object(self, request, object_id, from_field=None):
+        job = super().get_object(request, object_id, from_field)
+        return with_live_progress(job) if job is not None else None
+
+    @admin.display(description='Progress')
+    def progress(self, job):
+        if job.progress_percent is None:
+            return f"{job.processed_rows} rows"
+        return f"{job.processed_rows}/{job.total_rows} ({job.progress_percent:.0f}%)"
+
+    @admin.display(description='Rows/s')
+    def rows_per_second(self, job):
+        return f"{job.throughput:,.0f}" if job.throughput else '-'
+
+    @admin.display(description='ETA')
+    def eta(self, job):
+        return f"{job.eta_seconds:.0f}s" if job.eta_seconds is not None else '-'
 
-admin.site.register(ChemicalComposition)
-admin.site.register(BNFHierarchy)
-admin.site.register(MedicationProduct)
-admin.site.register(MedicationPricingHistory)
-# admin.site.register(CostEffectivenessAppraisal) # <--- REMOVE THIS LINE
\ No newline at end of file
+    @admin.action(description='Queue selected imports again')
+    def queue_again(self, request, queryset):
+        for job in queryset:
+            enqueue_import(job.source, **job.options)
+        self.message_user(request, f"Queued {queryset.count()} import(s).")
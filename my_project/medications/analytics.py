@@ -0,0 +1,212 @@
+# medications/analytics.py
+
+import json
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router
+from django.utils import timezone
+
+from .data_version import get_data_version
+from .models import MedicationPricingHistory
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # Optional dependency, only needed for analytics snapshots
+    pa = None
+
+PARTITION_COLUMNS = ['bnf_chapter_code', 'period']
+LATEST_POINTER = 'LATEST'
+MANIFEST_FILE = '_manifest.json'
+CHUNK_SIZE = 50000
+
+# Joined product / BNF / pricing columns, in snapshot order: (ORM lookup, snapshot column)
+SNAPSHOT_FIELDS = [
+    ('id', 'pricing_id'),
+    ('product_id', 'product_id'),
+    ('product__npc_code', 'npc_code'),
+    ('product__product_name', 'product_name'),
+    ('product__bnf_code_15digit_id', 'bnf_code_15digit'),
+    ('product__bnf_code_15digit__bnf_chapter_code', 'bnf_chapter_code'),
+    ('product__bnf_code_15digit__bnf_chapter_name', 'bnf_chapter_name'),
+    ('product__bnf_code_15digit__bnf_section_name', 'bnf_section_name'),
+    ('product__bnf_code_15digit__bnf_paragraph_name', 'bnf_paragraph_name'),
+    ('product__chemical_name_id', 'chemical_name'),
+    ('source', 'source'),
+    ('price_gbp', 'price_gbp'),
+    ('period_start', 'period_start'),
+    ('period_end', 'period_end'),
+    ('usage_estimate', 'usage_estimate'),
+    ('price_change_measure', 'price_change_measure'),
+]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImproperlyConfigured("Analytics snapshots need pyarrow: pip install pyarrow")
+
+
+def snapshot_root():
+    return Path(getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', settings.BASE_DIR.parent / 'analytics'))
+
+
+def _snapshot_schema():
+    string_columns = {
+        'npc_code', 'product_name', 'bnf_code_15digit', 'bnf_chapter_code', 'bnf_chapter_name',
+        'bnf_section_name', 'bnf_paragraph_name', 'chemical_name', 'source', 'period',
+    }
+    fields = []
+    for _, column in SNAPSHOT_FIELDS:
+        if column in ('pricing_id', 'product_id'):
+            fields.append(pa.field(column, pa.int64()))
+        elif column in ('period_start', 'period_end'):
+            fields.append(pa.field(column, pa.date32()))
+        elif column in string_columns:
+            fields.append(pa.field(column, pa.string()))
+        else:
+            fields.append(pa.field(column, pa.float64()))
+    fields.append(pa.field('period', pa.string()))
+    return pa.schema(fields)
+
+
+def _partitioning():
+    # Explicit string types: inferring them would turn chapter '04' into the integer 4
+    return ds.partitioning(pa.schema([pa.field(column, pa.string()) for column in PARTITION_COLUMNS]), flavor='hive')
+
+
+# --- Writer ---
+def _record_batches(schema, counter, using, caller_thread):
+    """Streams the joined dataset out of the database as Arrow record batches, one chunk at a time."""
+    lookups = [lookup for lookup, _ in SNAPSHOT_FIELDS]
+    columns = [column for _, column in SNAPSHOT_FIELDS]
+    try:
+        rows = MedicationPricingHistory.objects.using(using).order_by().values_list(*lookups).iterator(chunk_size=CHUNK_SIZE)
+        while True:
+            chunk = [row for _, row in zip(range(CHUNK_SIZE), rows)]
+            if not chunk:
+                return
+            df = pd.DataFrame.from_records(chunk, columns=columns)
+            for column in ('price_gbp', 'usage_estimate', 'price_change_measure'):
+                df[column] = pd.to_numeric(df[column], errors='coerce')
+            df['period'] = pd.to_datetime(df['period_start']).dt.strftime('%Y-%m')
+            counter['rows'] += len(df)
+            yield from pa.Table.from_pandas(df, schema=schema, preserve_index=False).to_batches()
+    finally:
+        # pyarrow pulls batches on its own (pooled) thread, which gets its own Django connection;
+        # nothing else would ever close it. The caller's connection is left alone.
+        if threading.get_ident() != caller_thread:
+            connections[using].close()
+
+
+def write_snapshot(root=None, keep=3):
+    """Writes a Parquet snapshot of the joined dataset for the current data version.
+
+    Layout: <root>/v<data_version>/bnf_chapter_code=<code>/period=<YYYY-MM>/*.parquet, plus a
+    manifest. The snapshot is built in a temporary directory and renamed into place, so readers
+    never see a half-written version. Older versions beyond `keep` are removed.
+    Returns the manifest dict.
+    """
+    _require_pyarrow()
+    root = Path(root) if root else snapshot_root()
+    root.mkdir(parents=True, exist_ok=True)
+    version = get_data_version()
+    schema = _snapshot_schema()
+    counter = {'rows': 0}
+    # pyarrow consumes the batches on its own thread, where use_primary() is not in effect,
+    # so the database is chosen here
+    using = router.db_for_read(MedicationPricingHistory)
+
+    staging = Path(tempfile.mkdtemp(prefix=f".v{version}-", dir=root))
+    try:
+        ds.write_dataset(
+            _record_batches(schema, counter, using, threading.get_ident()),
+            staging,
+            schema=schema,
+            format='parquet',
+            partitioning=_partitioning(),
+            existing_data_behavior='overwrite_or_ignore',
+            max_rows_per_group=CHUNK_SIZE * 2,
+        )
+        manifest = {
+            'data_version': version,
+            'created_at': timezone.now().isoformat(),
+            'row_count': counter['rows'],
+            'partitioning': PARTITION_COLUMNS,
+            'columns': schema.names,
+        }
+        (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+
+        target = root / f"v{version}"
+        if target.exists():
+            shutil.rmtree(target)
+        staging.rename(target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    (root / LATEST_POINTER).write_text(target.name)
+    _prune_snapshots(root, keep)
+    return manifest
+
+
+def _prune_snapshots(root, keep):
+    versions = sorted(
+        (path for path in root.glob('v*') if path.is_dir() and path.name[1:].isdigit()),
+        key=lambda path: int(path.name[1:]),
+    )
+    for path in versions[:-keep] if keep else []:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# --- Reader ---
+def snapshot_path(version=None, root=None):
+    """Directory of a snapshot version (the latest one by default)."""
+    root = Path(root) if root else snapshot_root()
+    if version is None:
+        pointer = root / LATEST_POINTER
+        if not pointer.exists():
+            raise FileNotFoundError(f"No analytics snapshot found in {root}. Run export_analytics_snapshot.")
+        return root / pointer.read_text().strip()
+    return root / f"v{version}"
+
+
+def read_manifest(version=None, root=None):
+    return json.loads((snapshot_path(version, root) / MANIFEST_FILE).read_text())
+
+
+def open_snapshot(version=None, root=None):
+    """Returns a memory-mapped pyarrow Dataset over a snapshot; nothing is read until queried."""
+    _require_pyarrow()
+    return ds.dataset(
+        str(snapshot_path(version, root)),
+        format='parquet',
+        schema=_snapshot_schema(),  # Keeps column selection working on an empty snapshot
+        partitioning=_partitioning(),
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def load_snapshot(columns=None, filters=None, version=None, root=None):
+    """Reads a snapshot as an Arrow table.
+
+    `filters` is a pyarrow expression or DNF tuples such as [('bnf_chapter_code', '=', '04')];
+    partition filters prune whole directories, so only matching files are touched.
+    """
+    dataset = open_snapshot(version, root)
+    if filters is not None and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+    return dataset.to_table(columns=columns, filter=filters)
+
+
+def load_snapshot_frame(columns=None, filters=None, version=None, root=None):
+    """Like load_snapshot, but returns a pandas DataFrame built from the Arrow buffers without extra copies."""
+    table = load_snapshot(columns=columns, filters=filters, version=version, root=root)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
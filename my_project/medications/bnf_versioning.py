@@ -0,0 +1,104 @@
+# medications/bnf_versioning.py
+
+import hashlib
+
+import pandas as pd
+from django.db import transaction
+
+from .bulk_load import bulk_load
+from .models import BNFHierarchy, BNFHierarchyVersion
+
+# Fields whose change makes a new version; the code identifies the row, the rest is metadata
+CONTENT_FIELDS = [
+    'bnf_chapter_code', 'bnf_chapter_name', 'bnf_section_code', 'bnf_section_name',
+    'bnf_paragraph_code', 'bnf_paragraph_name', 'bnf_chemical_substance', 'bnf_presentation_description',
+]
+BNF_FIELDS = ['bnf_code_15digit'] + CONTENT_FIELDS + ['bnf_version', 'valid_from_date', 'valid_to_date']
+CLOSE_BATCH_SIZE = 1000
+HASH_SEPARATOR = '\x1f'  # ASCII unit separator, never part of the BNF text fields
+
+
+def row_content_hash(values):
+    """Hash of one row's CONTENT_FIELDS values, in that order; missing values hash like ''.
+
+    Only hashlib and the row's text go in, so stored hashes stay valid across library upgrades.
+    """
+    canonical = HASH_SEPARATOR.join('' if value is None else str(value) for value in values)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def content_hash(df):
+    """Per-row content hash of a BNF frame, as strings for storage."""
+    content = df.reindex(columns=CONTENT_FIELDS).astype(object)
+    content = content.where(content.notna(), None)
+    return pd.Series(
+        [row_content_hash(row) for row in content.itertuples(index=False, name=None)], index=df.index, dtype=object,
+    )
+
+
+def _load_open_versions():
+    rows = BNFHierarchyVersion.objects.current().values_list('id', 'bnf_code_15digit', 'content_hash')
+    return pd.DataFrame.from_records(rows.iterator(chunk_size=10000), columns=['version_id', 'bnf_code_15digit', 'current_hash'])
+
+
+def _close_versions(version_ids, bnf_codes, valid_to_date):
+    """Ends the given open versions, and the matching current BNFHierarchy rows, on valid_to_date."""
+    version_ids = list(version_ids)
+    bnf_codes = list(bnf_codes)
+    for start in range(0, len(version_ids), CLOSE_BATCH_SIZE):
+        BNFHierarchyVersion.objects.filter(
+            pk__in=version_ids[start:start + CLOSE_BATCH_SIZE]
+        ).update(valid_to_date=valid_to_date)
+    for start in range(0, len(bnf_codes), CLOSE_BATCH_SIZE):
+        BNFHierarchy.objects.filter(
+            pk__in=bnf_codes[start:start + CLOSE_BATCH_SIZE]
+        ).update(valid_to_date=valid_to_date)
+
+
+def diff_against_open_versions(df):
+    """Classifies an incoming release against the open versions.
+
+    Returns (merged, is_new, is_changed, retired) where `retired` lists open versions
+    whose code is missing from the release.
+    """
+    df = df.drop_duplicates(subset='bnf_code_15digit', keep='last').copy()
+    df['content_hash'] = content_hash(df)
+    open_versions = _load_open_versions()
+    merged = df.merge(open_versions, on='bnf_code_15digit', how='left')
+    is_new = merged['version_id'].isna()
+    is_changed = ~is_new & (merged['content_hash'] != merged['current_hash'])
+    retired = open_versions[~open_versions['bnf_code_15digit'].isin(df['bnf_code_15digit'])]
+    return merged, is_new, is_changed, retired
+
+
+def apply_versioned_import(df, retire_missing=True):
+    """Type-2 import of a BNF release.
+
+    Unchanged codes are not written at all. Changed codes have their open version closed on the
+    release's valid_from_date and a new version inserted; new codes just get a version. The current
+    BNFHierarchy row is upserted for changed and new codes only. With `retire_missing`, codes absent
+    from the release are closed too (their BNFHierarchy row stays, products may still point at it).
+    Returns a dict of counts.
+    """
+    merged, is_new, is_changed, retired = diff_against_open_versions(df)
+    touched = merged[is_new | is_changed].copy()
+    touched['valid_to_date'] = None
+
+    with transaction.atomic():
+        # Close before inserting: at most one open version per code is enforced by a partial unique index
+        for valid_from_date, group in merged[is_changed].groupby('valid_from_date'):
+            _close_versions(group['version_id'].astype(int), group['bnf_code_15digit'], valid_from_date)
+        if retire_missing and not retired.empty:
+            release_date = merged['valid_from_date'].max()
+            _close_versions(retired['version_id'], retired['bnf_code_15digit'], release_date)
+
+        bulk_load(touched.reindex(columns=BNF_FIELDS + ['content_hash']), BNFHierarchyVersion)
+        bulk_load(touched.reindex(columns=BNF_FIELDS), BNFHierarchy,
+                  conflict_fields=['bnf_code_15digit'], update_fields=BNF_FIELDS[1:])
+
+    return {
+        'new': int(is_new.sum()),
+        'changed': int(is_changed.sum()),
+        'unchanged': int(len(merged) - is_new.sum() - is_changed.sum()),
+        'retired': len(retired) if retire_missing else 0,
+    }
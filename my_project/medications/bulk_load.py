@@ -0,0 +1,131 @@
+# medications/bulk_load.py
+
+import io
+
+from django.db import NotSupportedError, connections, transaction
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _column_map(model, fields):
+    """Maps model field attnames (e.g. 'product_id') to their database column names."""
+    columns = {field.attname: field.column for field in model._meta.concrete_fields}
+    try:
+        return [columns[name] for name in fields]
+    except KeyError as e:
+        raise ValueError(f"{model.__name__} has no concrete field with attname {e}")
+
+
+def _iter_chunks(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def _chunk_rows(chunk):
+    """Converts a DataFrame chunk to plain Python tuples, with NaN/NaT as None."""
+    return list(chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None))
+
+
+def _merge_sql(qn, table, source, columns, conflict_columns, update_columns):
+    cols = ", ".join(qn(c) for c in columns)
+    sql = f"INSERT INTO {qn(table)} ({cols}) {source}"
+    if conflict_columns:
+        sql += f" ON CONFLICT ({', '.join(qn(c) for c in conflict_columns)})"
+        if update_columns:
+            sql += " DO UPDATE SET " + ", ".join(f"{qn(c)} = EXCLUDED.{qn(c)}" for c in update_columns)
+        else:
+            sql += " DO NOTHING"
+    return sql
+
+
+# --- PostgreSQL: COPY into a staging table, then one INSERT ... SELECT ... ON CONFLICT ---
+def _copy_chunk(cursor, staging_table, qn, columns, chunk):
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    copy_sql = f"COPY {qn(staging_table)} ({', '.join(qn(c) for c in columns)}) FROM STDIN"
+    if is_psycopg3:
+        with cursor.cursor.copy(copy_sql) as copy:
+            for row in _chunk_rows(chunk):
+                copy.write_row(row)
+    else:
+        # psycopg2: stream the chunk as CSV; unquoted empty fields are read back as NULL
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor.cursor.copy_expert(f"{copy_sql} WITH (FORMAT csv)", buffer)
+
+
+def _load_postgresql(connection, df, table, columns, conflict_columns, update_columns, chunk_size, progress):
+    qn = connection.ops.quote_name
+    staging_table = f"_staging_{table}"
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {qn(staging_table)}")
+        # Copy the column types only: no constraints, indexes or identity columns to slow the COPY down
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {qn(staging_table)} ON COMMIT DROP AS "
+            f"SELECT {', '.join(qn(c) for c in columns)} FROM {qn(table)} WITH NO DATA"
+        )
+        sent = 0
+        for chunk in _iter_chunks(df, chunk_size):
+            _copy_chunk(cursor, staging_table, qn, columns, chunk)
+            sent += len(chunk)
+            progress(sent)
+        source = f"SELECT {', '.join(qn(c) for c in columns)} FROM {qn(staging_table)}"
+        cursor.execute(_merge_sql(qn, table, source, columns, conflict_columns, update_columns))
+        written = cursor.rowcount
+        cursor.execute(f"DROP TABLE {qn(staging_table)}")
+    return written
+
+
+# --- SQLite: executemany with the same upsert semantics ---
+def _load_sqlite(connection, df, table, columns, conflict_columns, update_columns, chunk_size, progress):
+    qn = connection.ops.quote_name
+    source = f"VALUES ({', '.join(['%s'] * len(columns))})"
+    sql = _merge_sql(qn, table, source, columns, conflict_columns, update_columns)
+    written = sent = 0
+    with connection.cursor() as cursor:
+        for chunk in _iter_chunks(df, chunk_size):
+            cursor.executemany(sql, _chunk_rows(chunk))
+            written += cursor.rowcount
+            sent += len(chunk)
+            progress(sent)
+    return written
+
+
+def bulk_load(df, model, conflict_fields=None, update_fields=None, using='default', chunk_size=DEFAULT_CHUNK_SIZE,
+              progress=None):
+    """Writes every row of `df` into `model`'s table without instantiating model objects.
+
+    `df` columns must be model field attnames (use 'product_id', not 'product').
+    With `conflict_fields`, rows clashing on those (unique) columns update `update_fields`,
+    or are skipped when `update_fields` is empty. Without it, rows are plain inserts.
+    `progress`, if given, is called with the number of rows sent so far after each chunk.
+    Runs in a single transaction; returns the number of rows written.
+    """
+    if df.empty:
+        return 0
+    conflict_fields = list(conflict_fields or [])
+    update_fields = list(update_fields or [])
+    if update_fields and not conflict_fields:
+        raise ValueError("update_fields requires conflict_fields.")
+    if conflict_fields:
+        # An upsert can't touch the same row twice in one statement, so the last row per key wins
+        df = df.drop_duplicates(subset=conflict_fields, keep='last')
+
+    fields = list(df.columns)
+    columns = _column_map(model, fields)
+    conflict_columns = _column_map(model, conflict_fields)
+    update_columns = _column_map(model, update_fields)
+    table = model._meta.db_table
+
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        loader = _load_postgresql
+    elif connection.vendor == 'sqlite':
+        loader = _load_sqlite
+    else:
+        raise NotSupportedError(f"bulk_load does not support the '{connection.vendor}' backend.")
+
+    with transaction.atomic(using=using):
+        return loader(connection, df, table, columns, conflict_columns, update_columns, chunk_size,
+                      progress or (lambda sent: None))
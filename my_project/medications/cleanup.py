@@ -0,0 +1,86 @@
+# medications/cleanup.py
+
+from django.db import connection, connections
+from django.db.models import Exists, OuterRef, Q
+
+from .models import BNFHierarchy, ChemicalComposition, MedicationProduct
+
+# Prefixes used by import_emit_data for rows it creates before a product is reconciled
+PLACEHOLDER_BNF_PREFIX = 'BNF_NPC_'
+PLACEHOLDER_CHEMICAL_PREFIX = 'CHEM_NPC_'
+DEFAULT_BATCH_SIZE = 1000
+
+
+def orphaned_placeholder_bnf_entries():
+    """Placeholder BNF rows no product points at (NOT EXISTS anti-join)."""
+    return BNFHierarchy.objects.filter(
+        bnf_code_15digit__startswith=PLACEHOLDER_BNF_PREFIX,
+    ).filter(
+        ~Exists(MedicationProduct.objects.filter(bnf_code_15digit=OuterRef('pk')))
+    )
+
+
+def orphaned_placeholder_chemicals():
+    """Placeholder chemicals referenced by neither a product nor a BNF row that survives the purge."""
+    surviving_bnf_entries = BNFHierarchy.objects.filter(
+        Q(Exists(MedicationProduct.objects.filter(bnf_code_15digit=OuterRef('pk'))))
+        | ~Q(bnf_code_15digit__startswith=PLACEHOLDER_BNF_PREFIX)
+    )
+    return ChemicalComposition.objects.filter(
+        chemical_name__startswith=PLACEHOLDER_CHEMICAL_PREFIX,
+    ).filter(
+        ~Exists(MedicationProduct.objects.filter(chemical_name=OuterRef('chemical_name'))),
+        ~Exists(surviving_bnf_entries.filter(bnf_chemical_substance=OuterRef('chemical_name'))),
+    )
+
+
+def _delete_in_batches(queryset_factory, batch_size):
+    """Deletes rows matched by queryset_factory() in primary-key batches, re-checking the anti-join each time.
+
+    Each batch is one DELETE ... WHERE pk IN (<the orphan query limited to the batch>), so a row
+    re-referenced meanwhile is left alone. The anti-join already proves nothing points at these
+    rows, so there is nothing for QuerySet.delete()'s Collector to fetch or cascade.
+    """
+    deleted = 0
+    while True:
+        queryset = queryset_factory()
+        batch = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        model = queryset.model
+        db_connection = connections[queryset.db]
+        qn = db_connection.ops.quote_name
+        orphans_sql, params = queryset.filter(pk__in=batch).order_by().values('pk').query.sql_with_params()
+        with db_connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(model._meta.pk.column)} IN ({orphans_sql})", params,
+            )
+            deleted += cursor.rowcount
+
+
+def count_orphaned_placeholders():
+    return {
+        'bnf_entries': orphaned_placeholder_bnf_entries().count(),
+        'chemicals': orphaned_placeholder_chemicals().count(),
+    }
+
+
+def purge_orphaned_placeholders(batch_size=DEFAULT_BATCH_SIZE):
+    """Deletes unreferenced placeholder BNF rows, then the placeholder chemicals they freed.
+
+    Each batch commits on its own so locks stay short. Returns a dict of deleted counts.
+    """
+    return {
+        'bnf_entries': _delete_in_batches(orphaned_placeholder_bnf_entries, batch_size),
+        'chemicals': _delete_in_batches(orphaned_placeholder_chemicals, batch_size),
+    }
+
+
+def vacuum_reference_tables():
+    """Reclaims space and refreshes planner statistics after a large purge (PostgreSQL only)."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        for model in (BNFHierarchy, ChemicalComposition):
+            cursor.execute(f"VACUUM (ANALYZE) {connection.ops.quote_name(model._meta.db_table)}")
+    return True
@@ -0,0 +1,210 @@
+# medications/dashboard.py
+
+import gzip
+import math
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .data_version import get_data_version
+from .models import BNFHierarchy, MedicationPricingHistory, MedicationProduct
+from .pricing_trends import DEFAULT_SOURCE, latest_price_subquery
+from .reference_cache import get_reference_cache
+
+try:
+    import brotli
+except ImportError:  # Optional dependency, .br variants are skipped without it
+    brotli = None
+
+PAGE_SIZE = 100
+TEMPLATE_NAME = 'medications/medication_list.html'
+LATEST_POINTER = 'LATEST'
+ALL_SCOPE = 'all'
+
+
+# --- Queries ---
+def dashboard_queryset(chapter=None):
+    """Products with their latest eMIT price and total eMIT usage, computed in the same query.
+
+    Both values are correlated subqueries on pricing history, replacing the per-row queries
+    the dashboard used to run for every product.
+    """
+    emit_prices = MedicationPricingHistory.objects.filter(product=OuterRef('pk'), source=DEFAULT_SOURCE)
+    queryset = MedicationProduct.objects.annotate(
+        latest_emit_price_gbp=latest_price_subquery(DEFAULT_SOURCE),
+        emit_usage_items=Coalesce(
+            Subquery(emit_prices.order_by().values('product').annotate(total=Sum('usage_estimate')).values('total')),
+            Value(0),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        ),
+    ).order_by('product_name', 'id')
+    if chapter:
+        queryset = queryset.filter(bnf_code_15digit__bnf_chapter_code=chapter)
+    return queryset
+
+
+def dashboard_chapters():
+    """(code, name) of every BNF chapter that has at least one product."""
+    return list(
+        BNFHierarchy.objects
+        .filter(medication_products_bnf__isnull=False, bnf_chapter_code__isnull=False)
+        .values_list('bnf_chapter_code', 'bnf_chapter_name')
+        .order_by('bnf_chapter_code')
+        .distinct()
+    )
+
+
+def _row(med, references):
+    # BNF labels come from the in-process reference cache instead of a join on every page
+    code = med.bnf_code_15digit_id
+    has_price = med.latest_emit_price_gbp is not None
+    return {
+        'product_id': med.id,
+        'product_name': med.product_name,
+        'npc_code': med.npc_code,
+        'bnf_code_15digit': code or 'N/A',
+        'bnf_chapter_name': references.chapter_name(code) or 'N/A',
+        'bnf_chemical_substance': med.chemical_name_id or 'N/A',
+        'bnf_full_classification': references.full_classification(code) or 'N/A',
+        'latest_average_price_gbp': med.latest_emit_price_gbp if has_price else 'N/A',
+        'annual_usage_estimate_items': med.emit_usage_items,
+        'price_source': DEFAULT_SOURCE if has_price else 'N/A',
+    }
+
+
+def _page_context(rows, number, num_pages, total_count, chapters, chapter):
+    return {
+        'medications': rows,
+        'page_number': number,
+        'num_pages': num_pages,
+        'total_count': total_count,
+        'previous_page_number': number - 1 if number > 1 else None,
+        'next_page_number': number + 1 if number < num_pages else None,
+        'chapters': chapters,
+        'current_chapter': chapter,
+    }
+
+
+def dashboard_page_context(chapter=None, page_number=1):
+    """Template context for one dashboard page, rendered live from the database."""
+    page = Paginator(dashboard_queryset(chapter), PAGE_SIZE).get_page(page_number)
+    references = get_reference_cache()
+    return _page_context(
+        [_row(med, references) for med in page.object_list], page.number, page.paginator.num_pages,
+        page.paginator.count, dashboard_chapters(), chapter,
+    )
+
+
+# --- Static snapshot ---
+def snapshot_root():
+    return Path(getattr(settings, 'DASHBOARD_SNAPSHOT_DIR', settings.BASE_DIR.parent / 'dashboard'))
+
+
+def _scope(chapter):
+    # Only alphanumeric chapter codes get a directory, which also keeps request input out of paths
+    return f"chapter-{chapter}" if chapter else ALL_SCOPE
+
+
+def _write_page(directory, number, html):
+    """Writes page-<n>.html plus its precompressed .gz (and .br when brotli is installed) variants."""
+    data = html.encode('utf-8')
+    path = directory / f"page-{number}.html"
+    path.write_bytes(data)
+    (directory / f"{path.name}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        (directory / f"{path.name}.br").write_bytes(brotli.compress(data, quality=11))
+
+
+def write_dashboard_snapshot(root=None, keep=2):
+    """Renders every dashboard page (all products and each BNF chapter) to static HTML.
+
+    Layout: <root>/v<data_version>/<all|chapter-<code>>/page-<n>.html[.gz|.br]. Products are read in
+    one ordered pass and bucketed into pages per scope, so no page costs an OFFSET query. The
+    snapshot is built in a temporary directory and renamed into place before LATEST is updated.
+    Returns a summary dict.
+    """
+    root = Path(root) if root else snapshot_root()
+    root.mkdir(parents=True, exist_ok=True)
+    version = get_data_version()
+    chapters = dashboard_chapters()
+    chapter_counts = dict(
+        MedicationProduct.objects.filter(bnf_code_15digit__bnf_chapter_code__isnull=False)
+        .values_list('bnf_code_15digit__bnf_chapter_code').annotate(n=Count('id')).order_by()
+    )
+    totals = {None: MedicationProduct.objects.count()}
+    totals.update((code, n) for code, n in chapter_counts.items() if code.isalnum())
+
+    staging = Path(tempfile.mkdtemp(prefix=f".v{version}-", dir=root))
+    try:
+        buffers = {chapter: [] for chapter in totals}
+        page_numbers = {chapter: 0 for chapter in totals}
+        for chapter in totals:
+            (staging / _scope(chapter)).mkdir()
+
+        def flush(chapter):
+            page_numbers[chapter] += 1
+            num_pages = max(1, math.ceil(totals[chapter] / PAGE_SIZE))
+            context = _page_context(buffers[chapter], page_numbers[chapter], num_pages, totals[chapter], chapters, chapter)
+            _write_page(staging / _scope(chapter), page_numbers[chapter], render_to_string(TEMPLATE_NAME, context))
+            buffers[chapter] = []
+
+        references = get_reference_cache()
+        for med in dashboard_queryset().iterator(chunk_size=2000):
+            row = _row(med, references)
+            chapter = references.chapter_code(med.bnf_code_15digit_id)
+            for scope in ((None, chapter) if chapter is not None and chapter in totals else (None,)):
+                buffers[scope].append(row)
+                if len(buffers[scope]) == PAGE_SIZE:
+                    flush(scope)
+        for chapter in totals:
+            if buffers[chapter] or page_numbers[chapter] == 0:
+                flush(chapter)
+
+        target = root / f"v{version}"
+        if target.exists():
+            shutil.rmtree(target)
+        staging.rename(target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    (root / LATEST_POINTER).write_text(target.name)
+    _prune_snapshots(root, keep)
+    return {
+        'data_version': version,
+        'created_at': timezone.now().isoformat(),
+        'pages': sum(page_numbers.values()),
+        'scopes': len(totals),
+        'brotli': brotli is not None,
+    }
+
+
+def _prune_snapshots(root, keep):
+    versions = sorted(
+        (path for path in root.glob('v*') if path.is_dir() and path.name[1:].isdigit()),
+        key=lambda path: int(path.name[1:]),
+    )
+    for path in versions[:-keep] if keep else []:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def find_snapshot_page(chapter=None, page_number=1, root=None):
+    """Returns (data_version, path to page-<n>.html) when a snapshot of the current data exists, else None."""
+    if chapter and not chapter.isalnum():
+        return None
+    root = Path(root) if root else snapshot_root()
+    try:
+        name = (root / LATEST_POINTER).read_text().strip()
+    except FileNotFoundError:
+        return None
+    if name != f"v{get_data_version()}":
+        return None  # An import finished after this snapshot was rendered
+    path = root / name / _scope(chapter) / f"page-{page_number}.html"
+    return (int(name[1:]), path) if path.exists() else None
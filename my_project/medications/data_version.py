@@ -0,0 +1,22 @@
+# medications/data_version.py
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+DATA_VERSION_PK = 1
+
+
+def get_data_version():
+    """Returns the current data version (0 if nothing has been imported yet)."""
+    version = DataVersion.objects.filter(pk=DATA_VERSION_PK).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_data_version():
+    """Increments the data version after a successful import and returns the new value."""
+    with transaction.atomic():
+        DataVersion.objects.get_or_create(pk=DATA_VERSION_PK)
+        DataVersion.objects.filter(pk=DATA_VERSION_PK).update(version=F('version') + 1)
+    return get_data_version()
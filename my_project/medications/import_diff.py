@@ -0,0 +1,291 @@
+# medications/import_diff.py
+
+import numpy as np
+import pandas as pd
+
+from .bnf_versioning import BNF_FIELDS, CONTENT_FIELDS, diff_against_open_versions
+from .cleanup import PLACEHOLDER_BNF_PREFIX, PLACEHOLDER_CHEMICAL_PREFIX
+from .models import BNFHierarchy, ChemicalComposition, MedicationPricingHistory, MedicationProduct
+
+SAMPLE_SIZE = 5
+READ_CHUNK_SIZE = 10000
+SAMPLE_LABELS = {
+    'inserts': 'insert', 'updates': 'update', 'deletes': 'delete',
+    'duplicates_existing': 'duplicate', 'unmatched': 'unmatched',
+}
+
+
+# --- Reading current state into keyed frames (one pass per table, no locks beyond a plain SELECT) ---
+def _read_frame(queryset, columns):
+    return pd.DataFrame.from_records(queryset.order_by().iterator(chunk_size=READ_CHUNK_SIZE), columns=columns)
+
+
+def _same(left, right):
+    """Element-wise equality where two missing values count as equal."""
+    return (left == right).fillna(False).to_numpy(dtype=bool) | (left.isna() & right.isna()).to_numpy()
+
+
+def _samples(df, columns, sample_size):
+    return df.reindex(columns=columns).head(sample_size).astype(object).where(lambda frame: frame.notna(), None).to_dict('records')
+
+
+def _update_samples(both, key, compare, changed_masks, sample_size):
+    samples = []
+    for position in np.flatnonzero(np.logical_or.reduce(changed_masks, axis=0))[:sample_size]:
+        row = both.iloc[position]
+        sample = {column: row[column] for column in key}
+        sample['changes'] = {
+            field: (row[f"{field}_current"], row[field])
+            for field, mask in zip(compare, changed_masks) if mask[position]
+        }
+        samples.append(sample)
+    return samples
+
+
+def diff_frames(table, incoming, current, key, compare=(), numeric=(), include_deletes=False, sample_size=SAMPLE_SIZE):
+    """Diffs incoming rows against current rows on `key` with one outer merge.
+
+    Rows only in `incoming` are inserts, rows in both whose `compare` fields differ are updates,
+    and (with include_deletes) rows only in `current` are deletes. `numeric` fields are compared
+    as numbers, so Decimal('1.50') from the database equals 1.5 from a file.
+    Returns a dict of counts, per-field change counts and sample rows.
+    """
+    key, compare = list(key), list(compare)
+    incoming = incoming.reindex(columns=key + compare).drop_duplicates(subset=key, keep='last')
+    current = current.reindex(columns=key + compare).drop_duplicates(subset=key, keep='last')
+    for field in numeric:
+        incoming[field] = pd.to_numeric(incoming[field], errors='coerce')
+        current[field] = pd.to_numeric(current[field], errors='coerce')
+
+    merged = incoming.merge(current, on=key, how='outer', suffixes=('', '_current'), indicator=True)
+    inserts = merged[merged['_merge'] == 'left_only']
+    deletes = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+
+    changed_masks = [~_same(both[field], both[f"{field}_current"]) for field in compare]
+    is_updated = np.logical_or.reduce(changed_masks, axis=0) if compare else np.zeros(len(both), dtype=bool)
+
+    return {
+        'table': table,
+        'inserts': len(inserts),
+        'updates': int(is_updated.sum()),
+        'unchanged': int(len(both) - is_updated.sum()),
+        'deletes': len(deletes) if include_deletes else 0,
+        'changed_fields': {field: int(mask.sum()) for field, mask in zip(compare, changed_masks) if mask.any()},
+        'samples': {
+            'inserts': _samples(inserts, key + compare, sample_size),
+            'updates': _update_samples(both, key, compare, changed_masks, sample_size) if compare else [],
+            'deletes': _samples(deletes, key, sample_size) if include_deletes else [],
+        },
+    }
+
+
+# --- Pricing feeds (eMIT and other KIND_PRICING sources) ---
+def diff_pricing_import(df, source, key='npc_code', sample_size=SAMPLE_SIZE):
+    """What PricingWriter would write for a prepared pricing frame, without writing anything.
+
+    `df` has the canonical pricing columns (the product key, product_name, price_gbp,
+    usage_estimate, period_start, period_end); `source` is the MedicationPricingHistory.source it
+    is stored under and `key` the unique MedicationProduct field products are matched on.
+    Returns a list of per-table diff dicts in the order the import writes them.
+    """
+    products_df = df.drop_duplicates(subset=key, keep='last')
+    incoming_products = pd.DataFrame({
+        key: products_df[key],
+        'product_name': products_df['product_name'],
+        'latest_average_price_gbp': products_df['price_gbp'],
+    })
+    current_products = _read_frame(
+        MedicationProduct.objects.filter(**{f"{key}__isnull": False}).values_list(key, 'product_name', 'latest_average_price_gbp'),
+        [key, 'product_name', 'latest_average_price_gbp'],
+    )
+
+    # Placeholders are inserted for products seen for the first time and never updated
+    new_codes = products_df.loc[~products_df[key].isin(current_products[key]), key]
+    chemicals = diff_frames(
+        'Placeholder chemicals',
+        pd.DataFrame({'chemical_name': PLACEHOLDER_CHEMICAL_PREFIX + new_codes}),
+        _read_frame(ChemicalComposition.objects.filter(chemical_name__startswith=PLACEHOLDER_CHEMICAL_PREFIX)
+                    .values_list('chemical_name'), ['chemical_name']),
+        key=['chemical_name'], sample_size=sample_size,
+    )
+    bnf_entries = diff_frames(
+        'Placeholder BNF entries',
+        pd.DataFrame({'bnf_code_15digit': PLACEHOLDER_BNF_PREFIX + new_codes}),
+        _read_frame(BNFHierarchy.objects.filter(bnf_code_15digit__startswith=PLACEHOLDER_BNF_PREFIX)
+                    .values_list('bnf_code_15digit'), ['bnf_code_15digit']),
+        key=['bnf_code_15digit'], sample_size=sample_size,
+    )
+    products = diff_frames(
+        'Medication products', incoming_products, current_products, key=[key],
+        compare=['product_name', 'latest_average_price_gbp'], numeric=['latest_average_price_gbp'],
+        sample_size=sample_size,
+    )
+
+    # Pricing history is append-only: every row is inserted, so rows already recorded for
+    # the same product and period are reported as duplicates rather than updates
+    period_key = [key, 'period_start', 'period_end']
+    existing_prices = _read_frame(
+        MedicationPricingHistory.objects.filter(source=source, period_start__in=set(df['period_start']))
+        .values_list(f"product__{key}", 'period_start', 'period_end'),
+        period_key,
+    ).drop_duplicates()
+    already_recorded = df[period_key].merge(existing_prices, on=period_key, how='left', indicator=True)['_merge'].eq('both').to_numpy()
+    prices = {
+        'table': 'Pricing history',
+        'inserts': len(df),
+        'updates': 0,
+        'unchanged': 0,
+        'deletes': 0,
+        'changed_fields': {},
+        'duplicates_existing': int(already_recorded.sum()),
+        'samples': {
+            'inserts': _samples(df, [key, 'price_gbp', 'usage_estimate'], sample_size),
+            'updates': [],
+            'deletes': [],
+            'duplicates_existing': _samples(df[already_recorded], [key, 'price_gbp'], sample_size),
+        },
+    }
+    return [chemicals, bnf_entries, products, prices]
+
+
+# --- BNF import and reconciliation ---
+def _reconcile(products, bnf_after):
+    """In-memory version of BNFWriter's name-based reconciliation.
+
+    Each placeholder-linked product is matched to a non-placeholder BNF row whose presentation
+    description equals its name case-insensitively (lowest code wins when several match).
+    """
+    candidates = bnf_after[
+        ~bnf_after['bnf_code_15digit'].str.startswith(PLACEHOLDER_BNF_PREFIX)
+        & bnf_after['bnf_presentation_description'].notna()
+    ].assign(match_key=lambda frame: frame['bnf_presentation_description'].str.lower())
+    candidates = candidates.sort_values('bnf_code_15digit').drop_duplicates(subset='match_key', keep='first')
+
+    products = products.assign(match_key=products['product_name'].str.lower())
+    return products.merge(
+        candidates[['match_key', 'bnf_code_15digit', 'bnf_chemical_substance']].rename(columns={
+            'bnf_code_15digit': 'new_bnf_code_15digit', 'bnf_chemical_substance': 'new_chemical_name',
+        }),
+        on='match_key', how='left',
+    ).drop(columns='match_key')
+
+
+def diff_bnf_import(df, retire_missing=True, purge_placeholders=False, sample_size=SAMPLE_SIZE):
+    """What BNFWriter would do with a prepared BNF frame, without writing anything.
+
+    Returns a list of diff dicts: chemicals, BNF hierarchy versions, reconciliation and, with
+    purge_placeholders, the placeholders that would then be deleted.
+    """
+    current_bnf = _read_frame(BNFHierarchy.objects.values_list(*BNF_FIELDS), BNF_FIELDS)
+    current_chemicals = _read_frame(ChemicalComposition.objects.values_list('chemical_name'), ['chemical_name'])
+
+    chemicals = diff_frames(
+        'Chemicals', pd.DataFrame({'chemical_name': df['bnf_chemical_substance'].drop_duplicates()}),
+        current_chemicals, key=['chemical_name'], sample_size=sample_size,
+    )
+
+    # Counts come from the same hash comparison the import uses; samples show the changed fields
+    merged, is_new, is_changed, retired = diff_against_open_versions(df)
+    changed = merged[is_changed]
+    field_diff = diff_frames(
+        'BNF hierarchy', changed, current_bnf[current_bnf['bnf_code_15digit'].isin(changed['bnf_code_15digit'])],
+        key=['bnf_code_15digit'], compare=CONTENT_FIELDS, sample_size=sample_size,
+    )
+    hierarchy = {
+        'table': 'BNF hierarchy (versions)',
+        'inserts': int(is_new.sum()),
+        'updates': int(is_changed.sum()),
+        'unchanged': int(len(merged) - is_new.sum() - is_changed.sum()),
+        'deletes': len(retired) if retire_missing else 0,
+        'changed_fields': field_diff['changed_fields'],
+        'samples': {
+            'inserts': _samples(merged[is_new], ['bnf_code_15digit', 'bnf_presentation_description'], sample_size),
+            'updates': field_diff['samples']['updates'],
+            'deletes': _samples(retired, ['bnf_code_15digit'], sample_size) if retire_missing else [],
+        },
+    }
+
+    # Reconciliation runs against the hierarchy as it will be after the upsert
+    incoming = df.drop_duplicates(subset='bnf_code_15digit', keep='last').reindex(columns=BNF_FIELDS)
+    bnf_after = pd.concat([current_bnf, incoming]).drop_duplicates(subset='bnf_code_15digit', keep='last')
+    products = _read_frame(
+        MedicationProduct.objects.filter(npc_code__isnull=False, bnf_code_15digit__bnf_code_15digit__startswith=PLACEHOLDER_BNF_PREFIX)
+        .values_list('id', 'npc_code', 'product_name', 'bnf_code_15digit_id', 'chemical_name_id'),
+        ['id', 'npc_code', 'product_name', 'bnf_code_15digit', 'chemical_name'],
+    )
+    reconciled = _reconcile(products, bnf_after)
+    matched = reconciled['new_bnf_code_15digit'].notna()
+    reconciliation = {
+        'table': 'Product reconciliation',
+        'inserts': 0,
+        'updates': int(matched.sum()),
+        'unchanged': int((~matched).sum()),
+        'deletes': 0,
+        'changed_fields': {'bnf_code_15digit': int(matched.sum()), 'chemical_name': int(matched.sum())} if matched.any() else {},
+        'samples': {
+            'inserts': [],
+            'updates': [
+                {'npc_code': row.npc_code, 'changes': {
+                    'bnf_code_15digit': (row.bnf_code_15digit, row.new_bnf_code_15digit),
+                    'chemical_name': (row.chemical_name, row.new_chemical_name),
+                }}
+                for row in reconciled[matched].head(sample_size).itertuples()
+            ],
+            'deletes': [],
+            'unmatched': _samples(reconciled[~matched], ['npc_code', 'product_name'], sample_size),
+        },
+    }
+    diffs = [chemicals, hierarchy, reconciliation]
+
+    if purge_placeholders:
+        # Mirror cleanup.py: placeholders nothing references once reconciliation has relinked products
+        all_products = _read_frame(
+            MedicationProduct.objects.values_list('id', 'bnf_code_15digit_id', 'chemical_name_id'),
+            ['id', 'bnf_code_15digit', 'chemical_name'],
+        ).set_index('id')
+        relinked = reconciled[matched].set_index('id')
+        all_products.loc[relinked.index, 'bnf_code_15digit'] = relinked['new_bnf_code_15digit']
+        all_products.loc[relinked.index, 'chemical_name'] = relinked['new_chemical_name']
+
+        is_placeholder = bnf_after['bnf_code_15digit'].str.startswith(PLACEHOLDER_BNF_PREFIX)
+        referenced = bnf_after['bnf_code_15digit'].isin(all_products['bnf_code_15digit'])
+        orphaned_bnf = bnf_after[is_placeholder & ~referenced]
+        surviving_substances = bnf_after.loc[~is_placeholder | referenced, 'bnf_chemical_substance']
+        placeholder_chemicals = current_chemicals[
+            current_chemicals['chemical_name'].str.startswith(PLACEHOLDER_CHEMICAL_PREFIX)
+        ]
+        orphaned_chemicals = placeholder_chemicals[
+            ~placeholder_chemicals['chemical_name'].isin(all_products['chemical_name'])
+            & ~placeholder_chemicals['chemical_name'].isin(surviving_substances)
+        ]
+        for table, orphaned, key in (('Placeholder BNF entries (purge)', orphaned_bnf, 'bnf_code_15digit'),
+                                     ('Placeholder chemicals (purge)', orphaned_chemicals, 'chemical_name')):
+            diffs.append({
+                'table': table, 'inserts': 0, 'updates': 0, 'unchanged': 0, 'deletes': len(orphaned),
+                'changed_fields': {},
+                'samples': {'inserts': [], 'updates': [], 'deletes': _samples(orphaned, [key], sample_size)},
+            })
+    return diffs
+
+
+# --- Reporting ---
+def format_diff(diff):
+    """Human-readable lines for one diff dict, used by the import commands' --dry-run output."""
+    lines = [
+        f"{diff['table']}: {diff['inserts']} to insert, {diff['updates']} to update, "
+        f"{diff['deletes']} to delete, {diff['unchanged']} unchanged"
+    ]
+    if diff.get('duplicates_existing'):
+        lines.append(f"  {diff['duplicates_existing']} rows repeat a record already stored for this period")
+    if diff['changed_fields']:
+        lines.append("  changed fields: " + ", ".join(f"{field} ({count})" for field, count in diff['changed_fields'].items()))
+    for kind, samples in diff['samples'].items():
+        for sample in samples:
+            if 'changes' in sample:
+                keys = ", ".join(f"{k}={v}" for k, v in sample.items() if k != 'changes')
+                changes = "; ".join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in sample['changes'].items())
+                lines.append(f"  {SAMPLE_LABELS[kind]} {keys}: {changes}")
+            else:
+                lines.append(f"  {SAMPLE_LABELS[kind]} " + ", ".join(f"{k}={v!r}" for k, v in sample.items()))
+    return lines
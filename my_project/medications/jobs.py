@@ -0,0 +1,264 @@
+# medications/jobs.py
+
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from my_project.db_router import use_primary
+from .models import ImportJob
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the unique constraint on running jobs applies there
+    fcntl = None
+
+# Management command run for each job source
+JOB_COMMANDS = {
+    ImportJob.SOURCE_EMIT: 'import_emit_data',
+    ImportJob.SOURCE_BNF: 'import_and_reconcile_bnf_data',
+}
+PROGRESS_INTERVAL = 1.0  # Seconds between progress writes to the job row
+STALE_AFTER = timedelta(minutes=10)  # A running job without a heartbeat for this long is considered dead
+
+
+def enqueue_import(source, **options):
+    """Queues an import for `source`, or returns the job already queued for it."""
+    if source not in JOB_COMMANDS:
+        raise ValueError(f"Unknown import source '{source}'. Choose from: {', '.join(JOB_COMMANDS)}")
+    with use_primary():
+        existing = ImportJob.objects.filter(source=source, status=ImportJob.STATUS_QUEUED).first()
+        if existing:
+            return existing
+        return ImportJob.objects.create(source=source, options=options)
+
+
+class ProgressReporter:
+    """Thread-safe progress sink handed to import commands as their `progress` option.
+
+    Commands call it as progress(processed, total=None, stage=None); the worker thread
+    flushes the latest values to the job row (a side file on SQLite), so commands never write
+    outside their transaction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def __call__(self, processed, total=None, stage=None):
+        with self._lock:
+            self._state['processed_rows'] = int(processed)
+            if total is not None:
+                self._state['total_rows'] = int(total)
+            if stage is not None:
+                self._state['stage'] = stage[:255]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._state)
+
+
+class ImportBusyError(CommandError):
+    """Another import of the same source holds the import lock."""
+
+
+def _state_directory():
+    """Where lock and progress files go: next to a SQLite file (shared by everything using it), else the temp dir."""
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        return Path(connection.settings_dict['NAME']).resolve().parent
+    return Path(tempfile.gettempdir())
+
+
+def _lock_file_path(source):
+    return _state_directory() / f".medications-import-{source}.lock"
+
+
+def _progress_file_path(job_pk):
+    return _state_directory() / f".medications-import-job-{job_pk}.json"
+
+
+@contextmanager
+def import_lock(source):
+    """Single-flight lock for imports of `source`; yields False if another import holds it.
+
+    Taken by the import commands for the whole run, so manual runs and
+    worker jobs exclude each other. PostgreSQL uses a session advisory lock on the current
+    connection; other backends an exclusive flock on a lock file next to the database, which
+    the OS releases if the process dies.
+    """
+    if connection.vendor == 'postgresql':
+        key = zlib.crc32(f"medications.import.{source}".encode())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [key])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+        return
+
+    if fcntl is None:
+        yield True
+        return
+    with open(_lock_file_path(source), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _worker_alive(worker):
+    """False only when `worker` ("host:pid") is a process on this host that no longer exists."""
+    host, _, pid = worker.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit() or os.name == 'nt':
+        return True  # Can't tell from here (and os.kill would terminate the process on Windows)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists, owned by another user
+    return True
+
+
+def fail_stale_jobs():
+    """Marks running jobs whose worker is gone as failed.
+
+    Where heartbeats are written to the job row, a job is stale after STALE_AFTER without one. On
+    SQLite they go to a side file instead (see _write_progress), so there a job is stale once its
+    worker process no longer exists.
+    """
+    running = ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING)
+    if connection.vendor == 'sqlite':
+        stale = [job.pk for job in running.only('pk', 'worker') if not _worker_alive(job.worker)]
+        running = running.filter(pk__in=stale)
+    else:
+        running = running.filter(heartbeat_at__lt=timezone.now() - STALE_AFTER)
+    return running.update(
+        status=ImportJob.STATUS_FAILED, finished_at=timezone.now(), error='Worker stopped responding.',
+    )
+
+
+def _claim(job):
+    """Moves a queued job to running. Returns False if the job was taken or its source is busy."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            claimed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_QUEUED).update(
+                status=ImportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now,
+                worker=f"{socket.gethostname()}:{os.getpid()}",
+            )
+    except IntegrityError:
+        return False  # Another job of this source is already running
+    return bool(claimed)
+
+
+def _run_command(job, reporter, outcome):
+    """Thread target: runs the job's command on its own database connection."""
+    output = io.StringIO()
+    try:
+        call_command(JOB_COMMANDS[job.source], progress=reporter, stdout=output, stderr=output, **job.options)
+    except ImportBusyError:
+        outcome['busy'] = True  # A manual run of the same source holds the import lock
+    except Exception as e:
+        outcome['error'] = f"{e}\n\n{output.getvalue()[-5000:]}"
+    finally:
+        connections.close_all()
+
+
+def _write_progress(job, reporter):
+    state = dict(reporter.snapshot(), heartbeat_at=timezone.now())
+    if connection.vendor != 'sqlite':
+        ImportJob.objects.filter(pk=job.pk).update(**state)
+        return
+    # SQLite has a single writer lock, which the import's transaction holds for most of the run, so
+    # progress goes to a side file that with_live_progress() reads instead of competing for it
+    path = _progress_file_path(job.pk)
+    staging = path.with_name(f"{path.name}.tmp")
+    staging.write_text(json.dumps(state, cls=DjangoJSONEncoder))
+    os.replace(staging, path)  # Readers never see a half-written file
+
+
+def with_live_progress(job):
+    """Returns `job` with the progress of its running import, on SQLite read from the side file.
+
+    Elsewhere progress is written to the job row itself, so the job is returned unchanged.
+    """
+    if job.status != ImportJob.STATUS_RUNNING or connection.vendor != 'sqlite':
+        return job
+    try:
+        state = json.loads(_progress_file_path(job.pk).read_text())
+    except (OSError, ValueError):
+        return job
+    heartbeat_at = parse_datetime(state.pop('heartbeat_at', '') or '')
+    if heartbeat_at is None or (job.started_at and heartbeat_at < job.started_at):
+        return job  # Left behind by an earlier job with the same id
+    for field, value in state.items():
+        setattr(job, field, value)
+    job.heartbeat_at = heartbeat_at
+    return job
+
+
+def run_job(job):
+    """Runs one queued job to completion. Returns False if it couldn't start.
+
+    The import command takes the per-source import lock itself; if another import holds it,
+    the job goes back to the queue.
+    """
+    with use_primary():
+        if not _claim(job):
+            return False
+
+        reporter = ProgressReporter()
+        outcome = {}
+        thread = threading.Thread(target=_run_command, args=(job, reporter, outcome), daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(PROGRESS_INTERVAL)
+            _write_progress(job, reporter)
+
+        if outcome.get('busy'):
+            ImportJob.objects.filter(pk=job.pk).update(
+                status=ImportJob.STATUS_QUEUED, started_at=None, heartbeat_at=None, worker='',
+            )
+            _progress_file_path(job.pk).unlink(missing_ok=True)
+            return False
+
+        status = ImportJob.STATUS_FAILED if 'error' in outcome else ImportJob.STATUS_SUCCEEDED
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=status, finished_at=timezone.now(), heartbeat_at=timezone.now(),
+            error=outcome.get('error', ''), **reporter.snapshot(),
+        )
+        _progress_file_path(job.pk).unlink(missing_ok=True)
+        return True
+
+
+def run_next_job():
+    """Runs the oldest queued job whose source is free. Returns the job, or None if nothing ran."""
+    with use_primary():
+        queued = ImportJob.objects.filter(status=ImportJob.STATUS_QUEUED).order_by('created_at')
+        for job in queued:
+            if run_job(job):
+                job.refresh_from_db()
+                return job
+    return None
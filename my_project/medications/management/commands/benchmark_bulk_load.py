@@ -0,0 +1,112 @@
+# medications/management/commands/benchmark_bulk_load.py
+
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from my_project.db_router import use_primary
+from medications.bulk_load import bulk_load
+from medications.models import BNFHierarchy, MedicationPricingHistory, MedicationProduct
+
+
+class _Rollback(Exception):
+    """Raised to discard everything a benchmark run wrote."""
+
+
+class Command(BaseCommand):
+    help = 'Compares the ORM write path with bulk_load for pricing history and BNF rows. All writes are rolled back.'
+
+    def execute(self, *args, **options):
+        # Keep every query on the primary so the command reads back what it just wrote
+        with use_primary():
+            return super().execute(*args, **options)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Number of synthetic rows per table.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='bulk_create batch size / bulk_load chunk size.')
+
+    def _timed(self, label, rows, func):
+        """Runs func inside a transaction that is always rolled back, and prints its throughput."""
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                func()
+                elapsed = time.perf_counter() - start
+                raise _Rollback
+        except _Rollback:
+            pass
+        self.stdout.write(f"  {label:<32} {elapsed:8.2f}s  {rows / elapsed:12,.0f} rows/s")
+        return elapsed
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        batch_size = options['batch_size']
+        rng = np.random.default_rng(0)
+        self.stdout.write(self.style.NOTICE(f"Benchmarking {rows} rows per table on '{connection.vendor}'."))
+
+        # --- Synthetic BNF frame ---
+        bnf_df = pd.DataFrame({
+            'bnf_code_15digit': [f"BENCH{i:010d}" for i in range(rows)],
+            'bnf_chapter_code': '01',
+            'bnf_chapter_name': 'Benchmark Chapter',
+            'bnf_chemical_substance': 'Benchmark Substance',
+            'bnf_presentation_description': [f"Benchmark presentation {i}" for i in range(rows)],
+            'bnf_version': 'benchmark',
+            'valid_from_date': date(2025, 1, 1),
+        })
+
+        def bnf_orm():
+            BNFHierarchy.objects.bulk_create(
+                [BNFHierarchy(**record) for record in bnf_df.to_dict('records')],
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['bnf_code_15digit'],
+                update_fields=['bnf_presentation_description'],
+            )
+
+        def bnf_bulk_load():
+            bulk_load(bnf_df, BNFHierarchy, conflict_fields=['bnf_code_15digit'],
+                      update_fields=['bnf_presentation_description'], chunk_size=batch_size)
+
+        self.stdout.write("BNFHierarchy upsert:")
+        orm = self._timed('ORM bulk_create(update_conflicts)', rows, bnf_orm)
+        fast = self._timed('bulk_load', rows, bnf_bulk_load)
+        self.stdout.write(self.style.SUCCESS(f"  speed-up: {orm / fast:.1f}x"))
+
+        # --- Synthetic pricing history frame (products are created inside each timed run) ---
+        n_products = max(1, rows // 10)
+        pricing_df = pd.DataFrame({
+            'product_index': rng.integers(0, n_products, rows),
+            'source': 'Benchmark',
+            'price_gbp': rng.uniform(0.5, 500, rows).round(2),
+            'period_start': date(2025, 1, 1),
+            'period_end': date(2025, 12, 31),
+            'usage_estimate': rng.integers(1, 10000, rows).astype(float),
+        })
+
+        def create_products():
+            products = MedicationProduct.objects.bulk_create(
+                [MedicationProduct(npc_code=f"BENCH{i}") for i in range(n_products)], batch_size=batch_size
+            )
+            return np.array([product.pk for product in products])
+
+        def pricing_orm():
+            product_ids = create_products()
+            records = pricing_df.assign(product_id=product_ids[pricing_df['product_index']]).drop(columns='product_index')
+            MedicationPricingHistory.objects.bulk_create(
+                [MedicationPricingHistory(**record) for record in records.to_dict('records')], batch_size=batch_size
+            )
+
+        def pricing_bulk_load():
+            product_ids = create_products()
+            records = pricing_df.assign(product_id=product_ids[pricing_df['product_index']]).drop(columns='product_index')
+            bulk_load(records, MedicationPricingHistory, chunk_size=batch_size)
+
+        self.stdout.write("MedicationPricingHistory insert:")
+        orm = self._timed('ORM bulk_create', rows, pricing_orm)
+        fast = self._timed('bulk_load', rows, pricing_bulk_load)
+        self.stdout.write(self.style.SUCCESS(f"  speed-up: {orm / fast:.1f}x"))
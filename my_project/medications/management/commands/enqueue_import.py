@@ -0,0 +1,27 @@
+# medications/management/commands/enqueue_import.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medications.jobs import JOB_COMMANDS, enqueue_import
+
+
+class Command(BaseCommand):
+    help = 'Queues an import for the background worker (run_import_worker) instead of running it here.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=sorted(JOB_COMMANDS), help='Which import to queue.')
+        parser.add_argument(
+            '--purge-placeholders',
+            action='store_true',
+            help='(bnf only) Delete orphaned placeholder rows after reconciliation.',
+        )
+
+    def handle(self, *args, **options):
+        job_options = {}
+        if options['purge_placeholders']:
+            if options['source'] != 'bnf':
+                raise CommandError("--purge-placeholders only applies to the bnf import.")
+            job_options['purge_placeholders'] = True
+
+        job = enqueue_import(options['source'], **job_options)
+        self.stdout.write(self.style.SUCCESS(f"Queued {job} - poll /medications/api/import-jobs/{job.pk}/ for progress."))
@@ -0,0 +1,27 @@
+# medications/management/commands/export_analytics_snapshot.py
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from medications.analytics import snapshot_root, write_snapshot
+from my_project.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = 'Writes a versioned Parquet snapshot of products, BNF hierarchy and pricing history for analysts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help='Snapshot root directory (default: settings.ANALYTICS_SNAPSHOT_DIR).')
+        parser.add_argument('--keep', type=int, default=3, help='Number of snapshot versions to keep.')
+
+    def handle(self, *args, **options):
+        root = options['output_dir'] or snapshot_root()
+        try:
+            # Read from the primary so the snapshot matches the data version it is labelled with
+            with use_primary():
+                manifest = write_snapshot(root=root, keep=options['keep'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote snapshot v{manifest['data_version']} with {manifest['row_count']} rows to {root}."
+        ))
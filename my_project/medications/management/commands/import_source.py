@@ -0,0 +1,7 @@
+# medications/management/commands/import_source.py
+
+from medications.sources.command import SourceImportCommand
+
+
+class Command(SourceImportCommand):
+    help = 'Imports any registered source (medications/sources) through the shared import pipeline.'
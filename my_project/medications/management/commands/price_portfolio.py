@@ -0,0 +1,65 @@
+# medications/management/commands/price_portfolio.py
+
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medications.portfolio import parse_portfolio, parse_substitutions, price_portfolio
+from medications.pricing_trends import DEFAULT_SOURCE
+
+
+def _fmt(path):
+    return 'json' if path.suffix.lower() == '.json' else 'csv'
+
+
+class Command(BaseCommand):
+    help = 'Prices a portfolio (CSV/JSON of npc_code, quantity) at current prices, optionally with substitutions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('portfolio', type=Path, help='CSV with npc_code,quantity columns or a JSON list of lines.')
+        parser.add_argument(
+            '--substitutions', type=Path,
+            help='JSON object {"npc_code": "substitute_npc_code"} or CSV with npc_code,substitute_npc_code columns.',
+        )
+        parser.add_argument('--source', default=DEFAULT_SOURCE, help=f"Pricing source (default: {DEFAULT_SOURCE}).")
+        parser.add_argument('--output', type=Path, help='Write the per-line results to this CSV file.')
+        parser.add_argument('--top', type=int, default=10, help='Number of largest line deltas to print.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            path = options['portfolio']
+            lines = parse_portfolio(path.read_bytes(), fmt=_fmt(path))
+            path = options['substitutions']
+            substitutions = parse_substitutions(path.read_bytes(), fmt=_fmt(path)) if path else None
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        df, totals = price_portfolio(lines, substitutions, source=options['source'])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Priced {totals['lines']} lines ({totals['priced_lines']} priced, "
+            f"{totals['substituted_lines']} substituted) in {elapsed:.2f}s."
+        ))
+        self.stdout.write(f"  Current spend:  £{totals['current_spend_gbp']:,.2f}")
+        self.stdout.write(f"  Scenario spend: £{totals['scenario_spend_gbp']:,.2f}")
+        delta_pct = f" ({totals['delta_pct']:+.2f}%)" if totals['delta_pct'] is not None else ''
+        self.stdout.write(f"  Delta:          £{totals['delta_gbp']:+,.2f}{delta_pct}")
+        for status, count in sorted(totals['status_counts'].items()):
+            if status != 'ok':
+                self.stdout.write(self.style.WARNING(f"  {count} line(s) with status '{status}'"))
+
+        movers = df[df['delta_gbp'].fillna(0) != 0]
+        if options['top'] > 0 and len(movers):
+            self.stdout.write("Largest line deltas:")
+            for row in movers.reindex(movers['delta_gbp'].abs().sort_values(ascending=False).index).head(options['top']).itertuples():
+                self.stdout.write(
+                    f"  {row.npc_code} -> {row.substitute_npc_code}: £{row.delta_gbp:+,.2f} "
+                    f"({row.quantity:g} x £{row.unit_price_gbp} -> £{row.substitute_unit_price_gbp})"
+                )
+
+        if options['output']:
+            df.to_csv(options['output'], index=False)
+            self.stdout.write(f"Wrote per-line results to {options['output']}.")
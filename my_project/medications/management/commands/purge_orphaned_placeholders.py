@@ -0,0 +1,45 @@
+# medications/management/commands/purge_orphaned_placeholders.py
+
+from django.core.management.base import BaseCommand
+
+from my_project.db_router import use_primary
+from medications.cleanup import (
+    DEFAULT_BATCH_SIZE,
+    count_orphaned_placeholders,
+    purge_orphaned_placeholders,
+    vacuum_reference_tables,
+)
+from medications.data_version import bump_data_version
+
+
+class Command(BaseCommand):
+    help = 'Deletes BNF_NPC_/CHEM_NPC_ placeholder rows that no product references any more.'
+
+    def execute(self, *args, **options):
+        # Keep every query on the primary so the command reads back what it just wrote
+        with use_primary():
+            return super().execute(*args, **options)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be deleted.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows deleted per batch.')
+        parser.add_argument('--vacuum', action='store_true', help='Run VACUUM (ANALYZE) afterwards (PostgreSQL only).')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            counts = count_orphaned_placeholders()
+            self.stdout.write(self.style.NOTICE(
+                f"Dry run: would delete {counts['bnf_entries']} placeholder BNF entries "
+                f"and {counts['chemicals']} placeholder chemicals."
+            ))
+            return
+
+        deleted = purge_orphaned_placeholders(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted['bnf_entries']} placeholder BNF entries and {deleted['chemicals']} placeholder chemicals."
+        ))
+        if deleted['bnf_entries'] or deleted['chemicals']:
+            data_version = bump_data_version()
+            self.stdout.write(self.style.NOTICE(f"Data version is now {data_version}."))
+        if options['vacuum'] and vacuum_reference_tables():
+            self.stdout.write(self.style.SUCCESS("Vacuumed BNF hierarchy and chemical composition tables."))
@@ -0,0 +1,59 @@
+# medications/management/commands/reference_cache_stats.py
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from medications.models import BNFHierarchy, MedicationProduct
+from medications.reference_cache import get_reference_cache, reference_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Loads the in-process BNF/chemical/product reference cache and reports its size, load time and hit rate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lookups', type=int, default=10000,
+            help='Random lookups to run against the cache (half BNF codes, half NPC codes) before reporting.',
+        )
+        parser.add_argument(
+            '--compare-orm', type=int, default=200,
+            help='Also time this many equivalent ORM lookups for comparison (0 to skip).',
+        )
+
+    def handle(self, *args, **options):
+        references = get_reference_cache(refresh=True)
+        rng = random.Random(0)
+
+        lookups = options['lookups']
+        if lookups:
+            bnf_codes = list(BNFHierarchy.objects.values_list('bnf_code_15digit', flat=True)[:5000]) or ['']
+            npc_codes = list(MedicationProduct.objects.exclude(npc_code=None).values_list('npc_code', flat=True)[:5000]) or ['']
+            start = time.perf_counter()
+            for _ in range(lookups // 2):
+                references.full_classification(rng.choice(bnf_codes))
+                references.product_id(rng.choice(npc_codes))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"Cache: {lookups} lookups in {elapsed * 1000:.1f}ms ({lookups / elapsed:,.0f} lookups/s)")
+
+            orm_lookups = min(options['compare_orm'], lookups)
+            if orm_lookups:
+                start = time.perf_counter()
+                for _ in range(orm_lookups // 2):
+                    bnf = BNFHierarchy.objects.filter(pk=rng.choice(bnf_codes)).first()
+                    bnf and bnf.full_classification
+                    MedicationProduct.objects.filter(npc_code=rng.choice(npc_codes)).values_list('id', flat=True).first()
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"ORM:   {orm_lookups} lookups in {elapsed * 1000:.1f}ms ({orm_lookups / elapsed:,.0f} lookups/s)")
+
+        stats = reference_cache_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reference cache v{stats['data_version']}: {stats['bnf_codes']} BNF codes "
+            f"({stats['distinct_labels']} distinct labels, {stats['presentations']} presentations), "
+            f"{stats['chemicals']} chemicals, {stats['products']} products."
+        ))
+        self.stdout.write(f"  Memory:   {stats['memory_bytes'] / 1024 / 1024:.1f} MiB")
+        self.stdout.write(f"  Load:     {stats['load_seconds']:.2f}s")
+        hit_rate = f"{stats['hit_rate'] * 100:.1f}%" if stats['hit_rate'] is not None else 'n/a'
+        self.stdout.write(f"  Hit rate: {hit_rate} ({stats['hits']} hits, {stats['misses']} misses)")
@@ -0,0 +1,25 @@
+# medications/management/commands/render_dashboard_snapshot.py
+
+from django.core.management.base import BaseCommand
+
+from medications.dashboard import snapshot_root, write_dashboard_snapshot
+from my_project.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = 'Renders every medication dashboard page to static, precompressed HTML for the current data version.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help='Snapshot root directory (default: settings.DASHBOARD_SNAPSHOT_DIR).')
+        parser.add_argument('--keep', type=int, default=2, help='Number of snapshot versions to keep.')
+
+    def handle(self, *args, **options):
+        root = options['output_dir'] or snapshot_root()
+        # Read from the primary so the pages match the data version they are labelled with
+        with use_primary():
+            summary = write_dashboard_snapshot(root=root, keep=options['keep'])
+        variants = 'gzip and brotli' if summary['brotli'] else 'gzip (install brotli for .br variants)'
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {summary['pages']} pages across {summary['scopes']} scopes for v{summary['data_version']} "
+            f"to {root}, with {variants}."
+        ))
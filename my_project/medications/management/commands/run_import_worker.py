@@ -0,0 +1,33 @@
+# medications/management/commands/run_import_worker.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from medications.jobs import fail_stale_jobs, run_next_job
+from my_project.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = 'Runs queued import jobs one at a time, polling the ImportJob table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run at most one job, then exit.')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        with use_primary():
+            stale = fail_stale_jobs()
+        if stale:
+            self.stdout.write(self.style.WARNING(f"Marked {stale} stale running job(s) as failed."))
+
+        self.stdout.write(self.style.SUCCESS("Import worker started."))
+        while True:
+            job = run_next_job()
+            if job:
+                style = self.style.SUCCESS if job.status == job.STATUS_SUCCEEDED else self.style.ERROR
+                self.stdout.write(style(f"{job}: {job.processed_rows} rows in {job.elapsed_seconds:.1f}s"))
+            if options['once']:
+                return
+            if not job:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:46
+
+import hashlib
+
+from django.db import migrations, models
+
+# Frozen copy of bnf_versioning.CONTENT_FIELDS / row_content_hash, so this migration never changes
+CONTENT_FIELDS = [
+    'bnf_chapter_code', 'bnf_chapter_name', 'bnf_section_code', 'bnf_section_name',
+    'bnf_paragraph_code', 'bnf_paragraph_name', 'bnf_chemical_substance', 'bnf_presentation_description',
+]
+
+
+def content_hash(row):
+    canonical = '\x1f'.join('' if row[field] is None else str(row[field]) for field in CONTENT_FIELDS)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def backfill_open_versions(apps, schema_editor):
+    """Seeds one open version per existing (non-placeholder) BNF code.
+
+    The content hash is the one a versioned import computes, so the next import only closes
+    and re-inserts the codes whose content actually changed.
+    """
+    BNFHierarchy = apps.get_model('medications', 'BNFHierarchy')
+    BNFHierarchyVersion = apps.get_model('medications', 'BNFHierarchyVersion')
+    db_alias = schema_editor.connection.alias
+    fields = ['bnf_code_15digit', *CONTENT_FIELDS, 'bnf_version', 'valid_from_date']
+    current = BNFHierarchy.objects.using(db_alias).exclude(bnf_code_15digit__startswith='BNF_NPC_').filter(
+        valid_from_date__isnull=False, valid_to_date__isnull=True,
+    ).values(*fields)
+    BNFHierarchyVersion.objects.using(db_alias).bulk_create(
+        (BNFHierarchyVersion(content_hash=content_hash(row), **row) for row in current.iterator(chunk_size=5000)),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medications', '0005_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BNFHierarchyVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bnf_code_15digit', models.CharField(max_length=15)),
+                ('bnf_chapter_code', models.CharField(blank=True, max_length=2, null=True)),
+                ('bnf_chapter_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('bnf_section_code', models.CharField(blank=True, max_length=5, null=True)),
+                ('bnf_section_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('bnf_paragraph_code', models.CharField(blank=True, max_length=7, null=True)),
+                ('bnf_paragraph_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('bnf_chemical_substance', models.CharField(blank=True, max_length=255, null=True)),
+                ('bnf_presentation_description', models.CharField(blank=True, max_length=500, null=True)),
+                ('bnf_version', models.CharField(blank=True, max_length=50, null=True)),
+                ('valid_from_date', models.DateField()),
+                ('valid_to_date', models.DateField(blank=True, null=True)),
+                ('content_hash', models.CharField(blank=True, max_length=20)),
+            ],
+            options={
+                'verbose_name': 'BNF Hierarchy Version',
+                'verbose_name_plural': 'BNF Hierarchy Versions',
+                'indexes': [models.Index(fields=['bnf_code_15digit', 'valid_from_date'], name='bnf_version_code_from_idx'), models.Index(fields=['valid_from_date', 'valid_to_date'], name='bnf_version_validity_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('valid_to_date__isnull', True)), fields=('bnf_code_15digit',), name='bnf_version_one_open_per_code')],
+            },
+        ),
+        migrations.RunPython(backfill_open_versions, migrations.RunPython.noop),
+    ]
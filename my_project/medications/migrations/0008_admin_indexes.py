@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medications', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bnfhierarchy',
+            name='bnf_chapter_code',
+            field=models.CharField(blank=True, db_index=True, max_length=2, null=True),
+        ),
+        migrations.AlterField(
+            model_name='bnfhierarchy',
+            name='bnf_presentation_description',
+            field=models.CharField(blank=True, db_index=True, max_length=500, null=True),
+        ),
+        migrations.AlterField(
+            model_name='medicationpricinghistory',
+            name='source',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='medicationproduct',
+            name='product_name',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='medicationpricinghistory',
+            index=models.Index(fields=['period_start', 'id'], name='pricing_period_start_id_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 # medications/models.py
 
 from django.db import models
-from django.db.models import Q # Keep this import if you used it in reconciliation
+from django.db.models import OuterRef, Q, Subquery
 
 # --- 1. Chemical_Composition Table ---
 class ChemicalComposition(models.Model):
@@ -18,14 +18,14 @@ class ChemicalComposition(models.Model):
 # --- 2. BNF_Hierarchy Table ---
 class BNFHierarchy(models.Model):
     bnf_code_15digit = models.CharField(max_length=15, primary_key=True)
-    bnf_chapter_code = models.CharField(max_length=2, blank=True, null=True)
+    bnf_chapter_code = models.CharField(max_length=2, blank=True, null=True, db_index=True)
     bnf_chapter_name = models.CharField(max_length=255, blank=True, null=True)
     bnf_section_code = models.CharField(max_length=5, blank=True, null=True)
     bnf_section_name = models.CharField(max_length=255, blank=True, null=True)
     bnf_paragraph_code = models.CharField(max_length=7, blank=True, null=True)
     bnf_paragraph_name = models.CharField(max_length=255, blank=True, null=True)
     bnf_chemical_substance = models.CharField(max_length=255, blank=True, null=True)
-    bnf_presentation_description = models.CharField(max_length=500, blank=True, null=True)
+    bnf_presentation_description = models.CharField(max_length=500, blank=True, null=True, db_index=True)
     bnf_version = models.CharField(max_length=50, blank=True, null=True)
     valid_from_date = models.DateField(blank=True, null=True)
     valid_to_date = models.DateField(blank=True, null=True)
@@ -50,9 +50,67 @@ class BNFHierarchy(models.Model):
         return " > ".join(parts) if parts else "N/A"
 
 
+# --- 2b. BNF_Hierarchy_Version Table (type-2 history of BNF_Hierarchy) ---
+# BNFHierarchy always holds the current classification; every release that changes a code's
+# content closes its open version here and opens a new one. Validity is half-open:
+# a version applies from valid_from_date up to (but not including) valid_to_date.
+class BNFHierarchyVersionQuerySet(models.QuerySet):
+    def current(self):
+        return self.filter(valid_to_date__isnull=True)
+
+    def as_of(self, date):
+        """Versions that were valid on `date` (at most one per BNF code)."""
+        return self.filter(valid_from_date__lte=date).filter(
+            Q(valid_to_date__isnull=True) | Q(valid_to_date__gt=date)
+        )
+
+
+class BNFHierarchyVersion(models.Model):
+    bnf_code_15digit = models.CharField(max_length=15)
+    bnf_chapter_code = models.CharField(max_length=2, blank=True, null=True)
+    bnf_chapter_name = models.CharField(max_length=255, blank=True, null=True)
+    bnf_section_code = models.CharField(max_length=5, blank=True, null=True)
+    bnf_section_name = models.CharField(max_length=255, blank=True, null=True)
+    bnf_paragraph_code = models.CharField(max_length=7, blank=True, null=True)
+    bnf_paragraph_name = models.CharField(max_length=255, blank=True, null=True)
+    bnf_chemical_substance = models.CharField(max_length=255, blank=True, null=True)
+    bnf_presentation_description = models.CharField(max_length=500, blank=True, null=True)
+    bnf_version = models.CharField(max_length=50, blank=True, null=True)
+    valid_from_date = models.DateField()
+    valid_to_date = models.DateField(blank=True, null=True)
+    content_hash = models.CharField(max_length=20, blank=True)
+
+    objects = BNFHierarchyVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "BNF Hierarchy Version"
+        verbose_name_plural = "BNF Hierarchy Versions"
+        indexes = [
+            # Serves per-code as-of lookups (and the correlated subquery in with_bnf_as_of)
+            models.Index(fields=['bnf_code_15digit', 'valid_from_date'], name='bnf_version_code_from_idx'),
+            # Serves catalogue-wide as-of queries without touching every version
+            models.Index(fields=['valid_from_date', 'valid_to_date'], name='bnf_version_validity_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bnf_code_15digit'],
+                condition=Q(valid_to_date__isnull=True),
+                name='bnf_version_one_open_per_code',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bnf_code_15digit} ({self.valid_from_date} to {self.valid_to_date or 'current'})"
+
+    @property
+    def full_classification(self):
+        parts = [name for name in (self.bnf_chapter_name, self.bnf_section_name, self.bnf_paragraph_name) if name]
+        return " > ".join(parts) if parts else "N/A"
+
+
 # --- 3. Medication_Products Table (Core Entity) ---
 class MedicationProduct(models.Model):
-    product_name = models.CharField(max_length=255, blank=True, null=True)
+    product_name = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     npc_code = models.CharField(max_length=50, unique=True, blank=True, null=True)
 
     bnf_code_15digit = models.ForeignKey(
@@ -96,25 +154,142 @@ class MedicationProduct(models.Model):
 
 
 # --- 4. Medication_Pricing_History Table ---
+class MedicationPricingHistoryQuerySet(models.QuerySet):
+    def with_bnf_as_of(self, date_field='period_start'):
+        """Annotates each price with the BNF classification that was valid on its `date_field`.
+
+        Uses one correlated subquery per annotation, served by the (code, valid_from) index,
+        so only the single matching version per row is read.
+        """
+        versions = BNFHierarchyVersion.objects.filter(
+            bnf_code_15digit=OuterRef('product__bnf_code_15digit'),
+            valid_from_date__lte=OuterRef(date_field),
+        ).filter(
+            Q(valid_to_date__isnull=True) | Q(valid_to_date__gt=OuterRef(date_field))
+        ).order_by('-valid_from_date')
+        return self.annotate(**{
+            f"{field}_as_of": Subquery(versions.values(field)[:1])
+            for field in ('bnf_chapter_name', 'bnf_section_name', 'bnf_paragraph_name',
+                          'bnf_chemical_substance', 'bnf_version')
+        })
+
+
 class MedicationPricingHistory(models.Model):
     product = models.ForeignKey(
         MedicationProduct,
         on_delete=models.CASCADE,
         related_name='pricing_history'
     )
-    source = models.CharField(max_length=255)
+    source = models.CharField(max_length=255, db_index=True)
     price_gbp = models.DecimalField(max_digits=10, decimal_places=2)
     period_start = models.DateField()
     period_end = models.DateField()
     usage_estimate = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     price_change_measure = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
 
+    objects = MedicationPricingHistoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Medication Pricing History"
         verbose_name_plural = "Medication Pricing Histories"
         ordering = ['-period_start']
+        indexes = [
+            # Serves the default -period_start ordering (plus the pk tiebreaker the admin adds) with LIMIT
+            models.Index(fields=['period_start', 'id'], name='pricing_period_start_id_idx'),
+        ]
 
     def __str__(self):
         return f"Price for {self.product.product_name if self.product.product_name else self.product.npc_code} from {self.source} ({self.period_start} to {self.period_end}): £{self.price_gbp}"
 
-# --- CostEffectivenessAppraisal Table is REMOVED ---
\ No newline at end of file
+# --- CostEffectivenessAppraisal Table is REMOVED ---
+
+
+# --- 5. Data_Version Table ---
+# Single-row counter bumped after every successful import. Derived data (trend reports,
+# caches) is keyed on this value so it is recomputed only when the data actually changes.
+class DataVersion(models.Model):
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Data Version"
+        verbose_name_plural = "Data Versions"
+
+    def __str__(self):
+        return f"Data version {self.version} (updated {self.updated_at:%Y-%m-%d %H:%M})"
+
+
+# --- 6. Import_Job Table ---
+# Queue of import/reconcile runs executed by the run_import_worker command (see medications/jobs.py).
+class ImportJob(models.Model):
+    SOURCE_EMIT = 'emit'
+    SOURCE_BNF = 'bnf'
+    SOURCE_CHOICES = [
+        (SOURCE_EMIT, 'eMIT pricing import'),
+        (SOURCE_BNF, 'BNF import and reconciliation'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    options = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    stage = models.CharField(max_length=255, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Import Job"
+        verbose_name_plural = "Import Jobs"
+        ordering = ['-created_at']
+        constraints = [
+            # Backstop for the advisory lock: never two running imports of the same source
+            models.UniqueConstraint(
+                fields=['source'],
+                condition=Q(status='running'),
+                name='one_running_import_per_source',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_display()} #{self.pk} ({self.status})"
+
+    @property
+    def elapsed_seconds(self):
+        if not self.started_at:
+            return None
+        end = self.finished_at or self.heartbeat_at or self.started_at
+        return max((end - self.started_at).total_seconds(), 0.0)
+
+    @property
+    def throughput(self):
+        """Rows processed per second so far."""
+        elapsed = self.elapsed_seconds
+        return self.processed_rows / elapsed if elapsed else None
+
+    @property
+    def progress_percent(self):
+        if not self.total_rows:
+            return None
+        return min(100.0, 100.0 * self.processed_rows / self.total_rows)
+
+    @property
+    def eta_seconds(self):
+        if self.status != self.STATUS_RUNNING or not self.total_rows or not self.throughput:
+            return None
+        return max(self.total_rows - self.processed_rows, 0) / self.throughput
@@ -0,0 +1,188 @@
+# medications/portfolio.py
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from .models import MedicationProduct
+from .pricing_trends import DEFAULT_SOURCE, latest_price_subquery
+
+MAX_PORTFOLIO_LINES = 50000
+PRICE_LOOKUP_CHUNK = 5000  # NPC codes per IN (...) list, well inside every backend's parameter limit
+
+# Line statuses, from best to worst
+STATUS_OK = 'ok'
+STATUS_UNKNOWN_SUBSTITUTE = 'unknown_substitute'  # Substitute not found or unpriced, current price kept
+STATUS_NO_PRICE = 'no_price'
+STATUS_UNKNOWN_CODE = 'unknown_code'
+
+
+# --- Step 1: Parse portfolio and substitution inputs into frames ---
+def _normalise_columns(df):
+    df.columns = [str(column).strip().lower() for column in df.columns]
+    return df
+
+
+def _clean_codes(values):
+    return values.astype('string').str.strip()
+
+
+def parse_portfolio(data, fmt='csv'):
+    """Parses a portfolio into a frame of (npc_code, quantity), one row per input line.
+
+    `data` is CSV text/bytes with npc_code and quantity columns, or (fmt='json') a list of
+    {"npc_code": ..., "quantity": ...} objects. Raises ValueError on malformed input.
+    """
+    if fmt == 'json':
+        records = json.loads(data) if isinstance(data, (str, bytes)) else data
+        if not isinstance(records, list):
+            raise ValueError("A JSON portfolio must be a list of {\"npc_code\", \"quantity\"} objects.")
+        for number, record in enumerate(records, start=1):
+            if not isinstance(record, dict):
+                raise ValueError(f"Portfolio line {number} is not an object with npc_code and quantity.")
+            if record.get('npc_code') is not None and not isinstance(record['npc_code'], str):
+                raise ValueError(f"Portfolio line {number}: npc_code must be a string.")
+        df = pd.DataFrame.from_records(records)
+    else:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8-sig')
+        df = pd.read_csv(io.StringIO(data), dtype=str, skipinitialspace=True)
+    df = _normalise_columns(df)
+
+    missing = {'npc_code', 'quantity'} - set(df.columns)
+    if missing:
+        raise ValueError(f"Portfolio is missing column(s): {', '.join(sorted(missing))}.")
+    if len(df) > MAX_PORTFOLIO_LINES:
+        raise ValueError(f"Portfolio has {len(df)} lines; the limit is {MAX_PORTFOLIO_LINES}.")
+
+    df = df[['npc_code', 'quantity']].copy()
+    df['npc_code'] = _clean_codes(df['npc_code'])
+    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce')
+    invalid = df['npc_code'].isna() | (df['npc_code'] == '') | df['quantity'].isna()
+    if invalid.any():
+        first = int(np.flatnonzero(invalid.to_numpy())[0]) + 1
+        raise ValueError(
+            f"{int(invalid.sum())} line(s) have a missing NPC code or a non-numeric quantity (first: line {first})."
+        )
+    return df.reset_index(drop=True)
+
+
+def parse_substitutions(data, fmt='json'):
+    """Parses a substitution map into a Series of substitute NPC codes indexed by original NPC code.
+
+    Accepts a JSON object {"<npc_code>": "<substitute>", ...}, a dict, or CSV with npc_code and
+    substitute_npc_code columns.
+    """
+    if data is None or (isinstance(data, (str, bytes)) and not data.strip()):
+        return pd.Series(dtype='string')
+    if fmt == 'json':
+        mapping = json.loads(data) if isinstance(data, (str, bytes)) else data
+        if not isinstance(mapping, dict) or not all(
+                isinstance(code, str) and isinstance(substitute, str) for code, substitute in mapping.items()):
+            raise ValueError("Substitutions must be a JSON object mapping NPC code to substitute NPC code.")
+        df = pd.DataFrame({'npc_code': list(mapping.keys()), 'substitute_npc_code': list(mapping.values())})
+    else:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8-sig')
+        df = _normalise_columns(pd.read_csv(io.StringIO(data), dtype=str, skipinitialspace=True))
+        missing = {'npc_code', 'substitute_npc_code'} - set(df.columns)
+        if missing:
+            raise ValueError(f"Substitutions are missing column(s): {', '.join(sorted(missing))}.")
+
+    codes = _clean_codes(df['npc_code'])
+    substitutes = _clean_codes(df['substitute_npc_code'])
+    if codes.duplicated().any():
+        raise ValueError(f"NPC code {codes[codes.duplicated()].iloc[0]} has more than one substitute.")
+    return pd.Series(substitutes.to_numpy(), index=codes.to_numpy(), dtype='string').dropna()
+
+
+# --- Step 2: Resolve prices in bulk ---
+def resolve_prices(npc_codes, source=DEFAULT_SOURCE):
+    """Looks up the latest `source` price of every NPC code, one query per PRICE_LOOKUP_CHUNK codes.
+
+    Returns a frame indexed by npc_code with product_name and price_gbp (NaN when the product
+    has no price). Codes without a product are absent.
+    """
+    codes = pd.unique(pd.Series(npc_codes, dtype='string').dropna())
+    records = []
+    for start in range(0, len(codes), PRICE_LOOKUP_CHUNK):
+        chunk = codes[start:start + PRICE_LOOKUP_CHUNK].tolist()
+        records.extend(
+            MedicationProduct.objects
+            .filter(npc_code__in=chunk)
+            .annotate(price_gbp=latest_price_subquery(source))
+            .values_list('npc_code', 'product_name', 'price_gbp')
+        )
+    df = pd.DataFrame.from_records(records, columns=['npc_code', 'product_name', 'price_gbp'])
+    df['price_gbp'] = pd.to_numeric(df['price_gbp'], errors='coerce')
+    return df.set_index('npc_code')
+
+
+# --- Step 3: Vectorized what-if pricing ---
+def _round(values):
+    return np.round(values.astype(float), 2)
+
+
+def price_portfolio(lines, substitutions=None, source=DEFAULT_SOURCE, prices=None):
+    """Prices every portfolio line at current prices and under the substitution scenario.
+
+    `lines` comes from parse_portfolio and `substitutions` from parse_substitutions. Spend is
+    quantity x latest price; lines whose code or price can't be resolved are reported but
+    contribute nothing to the totals. Returns (line frame, totals dict).
+    """
+    if substitutions is None:
+        substitutions = pd.Series(dtype='string')
+    if prices is None:
+        prices = resolve_prices(pd.concat([lines['npc_code'], substitutions]), source=source)
+
+    df = lines.copy()
+    df['product_name'] = df['npc_code'].map(prices['product_name'])
+    df['unit_price_gbp'] = df['npc_code'].map(prices['price_gbp']).astype(float)
+    df['substitute_npc_code'] = df['npc_code'].map(substitutions)
+    df['substitute_unit_price_gbp'] = df['substitute_npc_code'].map(prices['price_gbp']).astype(float)
+
+    known = df['npc_code'].isin(prices.index).to_numpy()
+    priced = ~np.isnan(df['unit_price_gbp'].to_numpy())
+    substituted = df['substitute_npc_code'].notna().to_numpy()
+    substitute_priced = ~np.isnan(df['substitute_unit_price_gbp'].to_numpy())
+
+    quantity = df['quantity'].to_numpy(dtype=float)
+    current_price = df['unit_price_gbp'].to_numpy()
+    # A substitution only applies when both sides are priced, so every delta compares like with like
+    switched = substituted & substitute_priced & priced
+    scenario_price = np.where(switched, df['substitute_unit_price_gbp'].to_numpy(), current_price)
+
+    df['current_spend_gbp'] = quantity * current_price
+    df['scenario_spend_gbp'] = quantity * scenario_price
+    df['delta_gbp'] = df['scenario_spend_gbp'] - df['current_spend_gbp']
+    df['status'] = np.select(
+        [~known, ~priced, substituted & ~substitute_priced],
+        [STATUS_UNKNOWN_CODE, STATUS_NO_PRICE, STATUS_UNKNOWN_SUBSTITUTE],
+        default=STATUS_OK,
+    )
+
+    current_total = float(np.nansum(df['current_spend_gbp'].to_numpy()))
+    scenario_total = float(np.nansum(df['scenario_spend_gbp'].to_numpy()))
+    totals = {
+        'source': source,
+        'lines': len(df),
+        'priced_lines': int(priced.sum()),
+        'substituted_lines': int(switched.sum()),
+        'status_counts': df['status'].value_counts().to_dict(),
+        'current_spend_gbp': round(current_total, 2),
+        'scenario_spend_gbp': round(scenario_total, 2),
+        'delta_gbp': round(scenario_total - current_total, 2),
+        'delta_pct': round((scenario_total - current_total) / current_total * 100, 2) if current_total else None,
+    }
+    for column in ('unit_price_gbp', 'substitute_unit_price_gbp', 'current_spend_gbp', 'scenario_spend_gbp', 'delta_gbp'):
+        df[column] = _round(df[column])
+    return df, totals
+
+
+def portfolio_report(lines, substitutions=None, source=DEFAULT_SOURCE):
+    """price_portfolio as a JSON-ready dict: totals plus one record per line (NaN becomes None)."""
+    df, totals = price_portfolio(lines, substitutions, source=source)
+    df = df.astype(object).where(df.notna(), None)
+    return {'totals': totals, 'lines': df.to_dict('records')}
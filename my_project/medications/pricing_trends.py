@@ -0,0 +1,203 @@
+# medications/pricing_trends.py
+
+from collections import namedtuple
+import warnings
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils.text import slugify
+
+from .data_version import get_data_version
+from .models import MedicationPricingHistory, MedicationProduct
+
+DEFAULT_SOURCE = 'eMIT Hospital Data'
+DEFAULT_WINDOW = 3
+DEFAULT_TOP_N = 20
+CACHE_TIMEOUT = 60 * 60 * 24  # Entries are keyed by data version, so they only need to expire eventually
+
+# Per-product price series aligned on a shared period axis.
+# prices/usage are (n_products, n_periods) float arrays with NaN where a product has no record.
+PriceSeries = namedtuple('PriceSeries', ['product_ids', 'periods', 'prices', 'usage'])
+
+
+def latest_price_subquery(source=DEFAULT_SOURCE, product_ref='pk'):
+    """Correlated subquery for a product's most recent price from `source`, for use in annotate()."""
+    prices = MedicationPricingHistory.objects.filter(product=OuterRef(product_ref), source=source)
+    return Subquery(prices.order_by('-period_start').values('price_gbp')[:1])
+
+
+# --- Step 1: Load pricing history into aligned arrays ---
+def load_price_frame(source=DEFAULT_SOURCE):
+    """Reads the pricing history for one source into a flat DataFrame in a single query."""
+    rows = (
+        MedicationPricingHistory.objects
+        .filter(source=source)
+        .order_by()  # Drop the model's default ordering, alignment does not need it
+        .values_list('product_id', 'period_start', 'price_gbp', 'usage_estimate')
+    )
+    df = pd.DataFrame.from_records(
+        rows.iterator(chunk_size=10000),
+        columns=['product_id', 'period_start', 'price_gbp', 'usage_estimate'],
+    )
+    df['price_gbp'] = pd.to_numeric(df['price_gbp'], errors='coerce')
+    df['usage_estimate'] = pd.to_numeric(df['usage_estimate'], errors='coerce')
+    return df
+
+
+def build_price_series(df):
+    """Pivots a flat pricing frame into a PriceSeries.
+
+    Duplicate (product, period) rows, e.g. from re-running an import, are averaged.
+    """
+    product_ids, product_idx = np.unique(df['product_id'].to_numpy(), return_inverse=True)
+    periods, period_idx = np.unique(df['period_start'].to_numpy(dtype='datetime64[D]'), return_inverse=True)
+    shape = (len(product_ids), len(periods))
+
+    prices = df['price_gbp'].to_numpy(dtype=float)
+    usage = df['usage_estimate'].to_numpy(dtype=float)
+
+    price_sum = np.zeros(shape)
+    price_count = np.zeros(shape)
+    usage_sum = np.zeros(shape)
+    usage_count = np.zeros(shape)
+    has_price = ~np.isnan(prices)
+    has_usage = ~np.isnan(usage)
+    np.add.at(price_sum, (product_idx[has_price], period_idx[has_price]), prices[has_price])
+    np.add.at(price_count, (product_idx[has_price], period_idx[has_price]), 1)
+    np.add.at(usage_sum, (product_idx[has_usage], period_idx[has_usage]), usage[has_usage])
+    np.add.at(usage_count, (product_idx[has_usage], period_idx[has_usage]), 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return PriceSeries(
+            product_ids=product_ids,
+            periods=periods,
+            prices=np.where(price_count > 0, price_sum / price_count, np.nan),
+            usage=np.where(usage_count > 0, usage_sum / usage_count, np.nan),
+        )
+
+
+# --- Step 2: Vectorized metrics over the whole catalogue ---
+def _last_valid(values):
+    """Returns the last non-NaN value of each row (NaN for all-NaN rows)."""
+    valid = ~np.isnan(values)
+    last_idx = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    last = values[np.arange(values.shape[0]), last_idx]
+    return np.where(valid.any(axis=1), last, np.nan)
+
+
+def _forward_fill(values):
+    """Carries the last observed value forward along each row."""
+    idx = np.where(~np.isnan(values), np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return values[np.arange(values.shape[0])[:, None], idx]
+
+
+def compute_price_trends(series, window=DEFAULT_WINDOW):
+    """Computes change, volatility and usage-weighted price for every product at once.
+
+    Returns a dict of arrays aligned with series.product_ids, plus the 2-D change matrices.
+    """
+    prices, usage = series.prices, series.usage
+    n_products, n_periods = prices.shape
+
+    # Period-over-period change against the previous *observed* price, so gaps don't break the series
+    previous = np.full_like(prices, np.nan)
+    if n_periods > 1:
+        previous[:, 1:] = _forward_fill(prices)[:, :-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        abs_change = prices - previous
+        pct_change = np.where(previous > 0, abs_change / previous, np.nan)
+
+    # Rolling volatility: standard deviation of the last `window` period changes
+    window = max(2, int(window))
+    padded = np.concatenate([np.full((n_products, window - 1), np.nan), pct_change], axis=1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+    observed = (~np.isnan(windows)).sum(axis=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # all-NaN windows
+        rolling_volatility = np.where(observed >= 2, np.nanstd(windows, axis=2, ddof=1), np.nan)
+
+    # Usage-weighted average price across all periods (falls back to the plain mean without usage)
+    weighted = ~np.isnan(prices) & ~np.isnan(usage)
+    usage_total = np.where(weighted, usage, 0).sum(axis=1)
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        weighted_price = np.where(weighted, prices * usage, 0).sum(axis=1) / usage_total
+        weighted_price = np.where(usage_total > 0, weighted_price, np.nanmean(prices, axis=1))
+
+    return {
+        'latest_price': _last_valid(prices),
+        'latest_abs_change': _last_valid(abs_change),
+        'latest_pct_change': _last_valid(pct_change),
+        'latest_volatility': _last_valid(rolling_volatility),
+        'usage_weighted_price': weighted_price,
+        'total_usage': usage_total,
+        'abs_change': abs_change,
+        'pct_change': pct_change,
+        'rolling_volatility': rolling_volatility,
+    }
+
+
+def largest_movers(trends, top_n=DEFAULT_TOP_N):
+    """Returns row indices of the top_n products by absolute latest percentage change."""
+    magnitude = np.abs(trends['latest_pct_change'])
+    candidates = np.flatnonzero(~np.isnan(magnitude))
+    if len(candidates) > top_n:
+        candidates = candidates[np.argpartition(-magnitude[candidates], top_n - 1)[:top_n]]
+    return candidates[np.argsort(-magnitude[candidates], kind='stable')]
+
+
+# --- Step 3: Cached report ---
+def _to_float(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def build_price_change_report(source=DEFAULT_SOURCE, window=DEFAULT_WINDOW, top_n=DEFAULT_TOP_N):
+    """Builds the 'biggest price changes' report straight from the database (uncached)."""
+    series = build_price_series(load_price_frame(source))
+    report = {
+        'source': source,
+        'window': window,
+        'periods': [str(period) for period in series.periods],
+        'product_count': len(series.product_ids),
+        'catalogue_usage_weighted_price': None,
+        'movers': [],
+    }
+    if not len(series.product_ids):
+        return report
+
+    trends = compute_price_trends(series, window=window)
+    usage_total = np.nansum(trends['total_usage'])
+    if usage_total > 0:
+        report['catalogue_usage_weighted_price'] = _to_float(
+            np.nansum(trends['usage_weighted_price'] * trends['total_usage']) / usage_total
+        )
+
+    rows = largest_movers(trends, top_n=top_n)
+    product_ids = series.product_ids[rows].tolist()
+    products = MedicationProduct.objects.in_bulk(product_ids)
+    for row, product_id in zip(rows, product_ids):
+        product = products.get(product_id)
+        report['movers'].append({
+            'product_id': product_id,
+            'product_name': product.product_name if product else None,
+            'npc_code': product.npc_code if product else None,
+            'latest_price_gbp': _to_float(trends['latest_price'][row]),
+            'change_gbp': _to_float(trends['latest_abs_change'][row]),
+            'change_pct': _to_float(trends['latest_pct_change'][row] * 100),
+            'volatility_pct': _to_float(trends['latest_volatility'][row] * 100),
+            'usage_weighted_price_gbp': _to_float(trends['usage_weighted_price'][row]),
+        })
+    return report
+
+
+def get_price_change_report(source=DEFAULT_SOURCE, window=DEFAULT_WINDOW, top_n=DEFAULT_TOP_N):
+    """Returns the price change report, recomputing it only when the data version changes."""
+    cache_key = f"medications:price_changes:v{get_data_version()}:{slugify(source)}:{window}:{top_n}"
+    report = cache.get(cache_key)
+    if report is None:
+        report = build_price_change_report(source=source, window=window, top_n=top_n)
+        cache.set(cache_key, report, CACHE_TIMEOUT)
+    return report
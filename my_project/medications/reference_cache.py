@@ -0,0 +1,218 @@
+# medications/reference_cache.py
+
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from .cleanup import PLACEHOLDER_BNF_PREFIX
+from .data_version import get_data_version
+from .models import BNFHierarchy, ChemicalComposition, MedicationProduct
+
+CHECK_INTERVAL = 5.0  # Seconds between data version checks; lookups in between trust the loaded copy
+READ_CHUNK_SIZE = 10000
+
+
+def _find(keys, key):
+    """Position of `key` in the sorted list `keys`, or -1."""
+    if key is None:
+        return -1
+    position = bisect_left(keys, key)
+    return position if position < len(keys) and keys[position] == key else -1
+
+
+class _StringTable:
+    """Deduplicates repeated labels (chapter, section, paragraph names) into one interned list."""
+    __slots__ = ('strings', '_index')
+
+    def __init__(self):
+        self.strings = ['']
+        self._index = {'': 0}
+
+    def add(self, value):
+        value = value or ''
+        position = self._index.get(value)
+        if position is None:
+            position = self._index[value] = len(self.strings)
+            self.strings.append(sys.intern(value))
+        return position
+
+
+class ReferenceCache:
+    """Read-only snapshot of BNF, chemical and product keys for one data version.
+
+    Every mapping is a sorted list of interned keys searched with bisect, with values in parallel
+    arrays; repeated labels are stored once in a string table and referenced by index.
+    """
+    __slots__ = (
+        'version', 'loaded_at', 'load_seconds', 'hits', 'misses',
+        '_bnf_codes', '_labels', '_chapter_codes', '_chapter_names', '_section_names',
+        '_paragraph_names', '_chemical_substances',
+        '_presentations', '_presentation_codes',
+        '_chemical_names', '_chemical_ids',
+        '_npc_codes', '_product_ids',
+    )
+
+    def __init__(self, version):
+        start = time.perf_counter()
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        labels = _StringTable()
+        bnf_rows = sorted(
+            BNFHierarchy.objects.order_by().values_list(
+                'bnf_code_15digit', 'bnf_chapter_code', 'bnf_chapter_name', 'bnf_section_name',
+                'bnf_paragraph_name', 'bnf_chemical_substance', 'bnf_presentation_description',
+            ).iterator(chunk_size=READ_CHUNK_SIZE)
+        )
+        self._bnf_codes = [sys.intern(row[0]) for row in bnf_rows]
+        self._chapter_codes = array('i', (labels.add(row[1]) for row in bnf_rows))
+        self._chapter_names = array('i', (labels.add(row[2]) for row in bnf_rows))
+        self._section_names = array('i', (labels.add(row[3]) for row in bnf_rows))
+        self._paragraph_names = array('i', (labels.add(row[4]) for row in bnf_rows))
+        self._chemical_substances = array('i', (labels.add(row[5]) for row in bnf_rows))
+        self._labels = labels.strings
+
+        # Lower-cased presentation -> position of the lowest non-placeholder code with that presentation
+        presentations = {}
+        for position, row in enumerate(bnf_rows):
+            if row[6] and not row[0].startswith(PLACEHOLDER_BNF_PREFIX):
+                presentations.setdefault(row[6].lower(), position)
+        self._presentations = sorted(presentations)
+        self._presentation_codes = array('i', (presentations[key] for key in self._presentations))
+        del bnf_rows, presentations
+
+        chemical_rows = sorted(ChemicalComposition.objects.order_by().values_list('chemical_name', 'id').iterator(
+            chunk_size=READ_CHUNK_SIZE))
+        self._chemical_names = [sys.intern(name) for name, _ in chemical_rows]
+        self._chemical_ids = array('q', (pk for _, pk in chemical_rows))
+
+        product_rows = sorted(
+            MedicationProduct.objects.filter(npc_code__isnull=False).order_by()
+            .values_list('npc_code', 'id').iterator(chunk_size=READ_CHUNK_SIZE)
+        )
+        self._npc_codes = [sys.intern(code) for code, _ in product_rows]
+        self._product_ids = array('q', (pk for _, pk in product_rows))
+
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - start
+
+    def _lookup(self, keys, key):
+        position = _find(keys, key)
+        if position < 0:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return position
+
+    def _label(self, column, code):
+        position = self._lookup(self._bnf_codes, code)
+        return self._labels[column[position]] or None if position >= 0 else None
+
+    # --- BNF ---
+    def has_bnf_code(self, code):
+        return self._lookup(self._bnf_codes, code) >= 0
+
+    def chapter_code(self, code):
+        return self._label(self._chapter_codes, code)
+
+    def chapter_name(self, code):
+        return self._label(self._chapter_names, code)
+
+    def chemical_substance(self, code):
+        return self._label(self._chemical_substances, code)
+
+    def full_classification(self, code):
+        """Same as BNFHierarchy.full_classification, without loading the row."""
+        position = self._lookup(self._bnf_codes, code)
+        if position < 0:
+            return None
+        parts = [self._labels[column[position]] for column in (self._chapter_names, self._section_names, self._paragraph_names)]
+        return " > ".join(part for part in parts if part) or "N/A"
+
+    def bnf_code_for_presentation(self, description):
+        """Non-placeholder BNF code whose presentation equals `description` case-insensitively."""
+        position = self._lookup(self._presentations, description.lower() if description else None)
+        return self._bnf_codes[self._presentation_codes[position]] if position >= 0 else None
+
+    # --- Chemicals and products ---
+    def chemical_id(self, chemical_name):
+        position = self._lookup(self._chemical_names, chemical_name)
+        return self._chemical_ids[position] if position >= 0 else None
+
+    def product_id(self, npc_code):
+        position = self._lookup(self._npc_codes, npc_code)
+        return self._product_ids[position] if position >= 0 else None
+
+    # --- Introspection ---
+    def memory_bytes(self):
+        """Approximate footprint: containers plus every distinct string object, counted once."""
+        containers = [getattr(self, name) for name in self.__slots__ if name.startswith('_')]
+        total = sum(sys.getsizeof(container) for container in containers)
+        seen = set()
+        for container in containers:
+            if isinstance(container, list):
+                for value in container:
+                    if id(value) not in seen:
+                        seen.add(id(value))
+                        total += sys.getsizeof(value)
+        return total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'data_version': self.version,
+            'loaded_at': self.loaded_at,
+            'load_seconds': round(self.load_seconds, 3),
+            'bnf_codes': len(self._bnf_codes),
+            'distinct_labels': len(self._labels),
+            'presentations': len(self._presentations),
+            'chemicals': len(self._chemical_names),
+            'products': len(self._npc_codes),
+            'memory_bytes': self.memory_bytes(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# --- Process-wide instance ---
+_lock = threading.Lock()
+_state = {'cache': None, 'checked_at': 0.0, 'loads': 0}
+
+
+def get_reference_cache(refresh=False):
+    """Returns the process-wide cache, loading it on first use.
+
+    The data version is checked at most every CHECK_INTERVAL seconds and the cache reloaded when
+    an import has bumped it. refresh=True reloads unconditionally, e.g. right after writing
+    reference data in the same process.
+    """
+    now = time.monotonic()
+    cache = _state['cache']
+    if cache is not None and not refresh and now - _state['checked_at'] < CHECK_INTERVAL:
+        return cache
+    with _lock:
+        cache = _state['cache']
+        version = get_data_version()
+        _state['checked_at'] = time.monotonic()
+        if refresh or cache is None or cache.version != version:
+            cache = _state['cache'] = ReferenceCache(version)
+            _state['loads'] += 1
+        return cache
+
+
+def invalidate_reference_cache():
+    """Drops the loaded copy; the next lookup reloads it."""
+    with _lock:
+        _state['cache'] = None
+
+
+def reference_cache_stats():
+    """Stats of the loaded cache in this process (without loading it), plus the number of loads."""
+    cache = _state['cache']
+    stats = cache.stats() if cache is not None else {'loaded': False}
+    stats['loads'] = _state['loads']
+    return stats
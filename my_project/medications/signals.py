@@ -0,0 +1,46 @@
+# medications/signals.py
+
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import Signal, receiver
+
+logger = logging.getLogger(__name__)
+
+# Sent by the import pipeline (sources/pipeline.py) after a successful import, once the data version has been bumped.
+# Arguments: source (the adapter name, e.g. 'emit' or 'bnf'), data_version.
+# Sent with send_robust: a receiver that raises is logged and doesn't fail the (already committed) import.
+import_completed = Signal()
+
+
+# Connected first so the receivers below already see the new reference data
+@receiver(import_completed, dispatch_uid='medications.invalidate_reference_cache')
+def invalidate_reference_cache(sender, **kwargs):
+    from .reference_cache import invalidate_reference_cache as invalidate
+
+    invalidate()
+
+
+@receiver(import_completed, dispatch_uid='medications.write_analytics_snapshot')
+def write_analytics_snapshot(sender, data_version, **kwargs):
+    if not getattr(settings, 'ANALYTICS_SNAPSHOT_ON_IMPORT', False):
+        return
+    from .analytics import write_snapshot
+
+    try:
+        manifest = write_snapshot()
+    except ImproperlyConfigured as e:
+        logger.warning("Skipping analytics snapshot: %s", e)
+        return
+    logger.info("Wrote analytics snapshot v%s (%s rows).", manifest['data_version'], manifest['row_count'])
+
+
+@receiver(import_completed, dispatch_uid='medications.render_dashboard_snapshot')
+def render_dashboard_snapshot(sender, data_version, **kwargs):
+    if not getattr(settings, 'DASHBOARD_SNAPSHOT_ON_IMPORT', False):
+        return
+    from .dashboard import write_dashboard_snapshot
+
+    summary = write_dashboard_snapshot()
+    logger.info("Rendered dashboard snapshot v%s (%s pages).", summary['data_version'], summary['pages'])
@@ -0,0 +1,22 @@
+# medications/sources/__init__.py
+"""Declarative source adapters feeding one shared import pipeline.
+
+A new feed is a SourceAdapter subclass (column map, coercions, required and key fields,
+reporting period, fetch) decorated with @register; `manage.py import_source <name>` then
+imports it with batching, validation, dry-run diffs and telemetry.
+"""
+
+from .base import (
+    KIND_BNF, KIND_PRICING, DatastoreSourceAdapter, FileSourceAdapter, SourceAdapter, SourceError,
+)
+from .pipeline import ImportTelemetry, format_telemetry, run_import
+from .registry import available_sources, get_adapter, register
+
+# Built-in sources register themselves on import
+from . import bnf, emit  # noqa: E402,F401
+
+__all__ = [
+    'KIND_BNF', 'KIND_PRICING', 'DatastoreSourceAdapter', 'FileSourceAdapter', 'ImportTelemetry',
+    'SourceAdapter', 'SourceError', 'available_sources', 'format_telemetry', 'get_adapter', 'register',
+    'run_import',
+]
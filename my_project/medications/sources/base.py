@@ -0,0 +1,203 @@
+# medications/sources/base.py
+
+from pathlib import Path
+
+import pandas as pd
+import requests
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Target kinds: which writer in sources/writers.py loads the prepared frame
+KIND_PRICING = 'pricing'  # Products upserted by NPC code + append-only pricing history rows
+KIND_BNF = 'bnf'          # Type-2 versioned BNF hierarchy, chemicals and product reconciliation
+
+
+class SourceError(Exception):
+    """A source could not be read (missing file, failed API call, unexpected layout)."""
+
+
+class SourceAdapter:
+    """Declarative description of one external feed.
+
+    Subclasses set class attributes and implement fetch(); the shared pipeline
+    (sources/pipeline.py) does coercion, validation, batching, writing and telemetry:
+
+    - name: registry key, also used as the import_completed `source`
+    - label: human-readable name; for pricing feeds, the MedicationPricingHistory.source value
+    - kind: KIND_PRICING or KIND_BNF
+    - column_map: raw column -> canonical field; unmapped columns are dropped
+    - coercions: canonical field -> 'string', 'numeric', 'money' (numeric, 2 dp), 'date'
+      or a callable(Series) -> Series
+    - required: fields a row must have (after coercion) to be loaded; others are rejected
+    - key_fields: identity of a row in the kind's target, used for upserts, lookups and dry-run
+      diffs; duplicates within a release keep the last occurrence. Pricing feeds name one unique
+      MedicationProduct field (npc_code for eMIT); BNF feeds are always ('bnf_code_15digit',)
+    - period_start / period_end: fixed reporting period, or override resolve_period()
+    - placeholder_version: bnf_version of the placeholder BNF rows a pricing feed creates for
+      new products (default "<label> Placeholder")
+    """
+    name = None
+    label = None
+    kind = None
+    column_map = {}
+    coercions = {}
+    required = ()
+    key_fields = ()
+    period_start = None
+    period_end = None
+    placeholder_version = None
+    chunk_size = DEFAULT_CHUNK_SIZE
+
+    def __init__(self, **options):
+        self.options = options
+        self._total_rows = None  # Set by fetch() as soon as the source tells
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name}>"
+
+    def describe(self):
+        """Where the data comes from, for log output."""
+        return self.label
+
+    def get_placeholder_version(self):
+        return self.placeholder_version or f"{self.label} Placeholder"
+
+    def fetch(self):
+        """Yields raw DataFrame chunks in source column names."""
+        raise NotImplementedError
+
+    def total_rows(self):
+        """Row count once fetch() has found it out (for progress reporting), else None."""
+        return self._total_rows
+
+    # --- Shared preparation steps (override to customise) ---
+    def rename(self, df):
+        df = df.rename(columns=self.column_map)
+        return df[[column for column in dict.fromkeys(self.column_map.values()) if column in df.columns]]
+
+    def coerce(self, df):
+        for field, coercion in self.coercions.items():
+            if field not in df.columns:
+                continue
+            if callable(coercion):
+                df[field] = coercion(df[field])
+            elif coercion == 'numeric':
+                df[field] = pd.to_numeric(df[field], errors='coerce')
+            elif coercion == 'money':
+                df[field] = pd.to_numeric(df[field], errors='coerce').round(2)
+            elif coercion == 'string':
+                df[field] = df[field].where(df[field].isna(), df[field].astype(str).str.strip())
+            elif coercion == 'date':
+                df[field] = pd.to_datetime(df[field], errors='coerce').dt.date
+            else:
+                raise ValueError(f"{self!r}: unknown coercion '{coercion}' for {field}")
+        return df
+
+    def resolve_period(self, df):
+        """Adds the reporting period columns; by default the adapter's fixed period."""
+        if self.period_start is not None:
+            df['period_start'] = self.period_start
+        if self.period_end is not None:
+            df['period_end'] = self.period_end
+        return df
+
+    def writer_columns(self):
+        """Columns the kind's writer reads besides the key (the writer's `columns`)."""
+        from .writers import WRITERS  # writers.py imports this module
+
+        return WRITERS[self.kind].columns
+
+    def validate(self, df):
+        """Splits a chunk into (valid rows, rejected rows) on the required fields.
+
+        Raises SourceError if a required, key or writer column is missing altogether.
+        """
+        expected = dict.fromkeys((*self.required, *self.key_fields, *self.writer_columns()))
+        missing = [field for field in expected if field not in df.columns]
+        if missing:
+            raise SourceError(f"{self.label}: source is missing column(s) for {', '.join(missing)}")
+        invalid = df[list(self.required)].isna().any(axis=1) if self.required else pd.Series(False, index=df.index)
+        return df[~invalid], df[invalid]
+
+    def prepare(self, raw):
+        """Raw chunk -> (canonical valid rows, rejected rows)."""
+        df = self.coerce(self.rename(raw).copy())
+        df = self.resolve_period(df)
+        return self.validate(df)
+
+
+class FileSourceAdapter(SourceAdapter):
+    """Feed delivered as a file under settings.DATA_DIR (CSV, ODS or Excel).
+
+    CSV is streamed in chunk_size pieces; spreadsheets are read whole and then sliced.
+    Pass path=... to read another file.
+    """
+    path = None
+    read_options = {}
+
+    def get_path(self):
+        return Path(self.options.get('path') or self.path)
+
+    def describe(self):
+        return f"{self.label} ({self.get_path()})"
+
+    def fetch(self):
+        path = self.get_path()
+        if not path.exists():
+            raise SourceError(f"{self.label} file not found at: {path}")
+        if path.suffix.lower() == '.csv':
+            # A first pass over one column gives the row count (quoted newlines included) for progress/ETA
+            self._total_rows = sum(
+                len(chunk) for chunk in
+                pd.read_csv(path, usecols=[0], chunksize=self.chunk_size * 10, **self.read_options)
+            )
+            yield from pd.read_csv(path, chunksize=self.chunk_size, **self.read_options)
+            return
+        engine = 'odf' if path.suffix.lower() == '.ods' else None
+        df = pd.read_excel(path, engine=engine, **self.read_options)
+        self._total_rows = len(df)
+        for start in range(0, len(df), self.chunk_size):
+            yield df.iloc[start:start + self.chunk_size]
+
+
+class DatastoreSourceAdapter(SourceAdapter):
+    """Feed published as an NHSBSA open data (CKAN datastore_search) resource, fetched page by page.
+
+    Pass resource_id=... to read another release of the same dataset.
+    """
+    api_url = "https://opendata.nhsbsa.net/api/action/datastore_search"
+    resource_id = None
+    page_size = 1000  # Max limit per request, common for CKAN APIs
+    api_token = None
+
+    def get_resource_id(self):
+        return self.options.get('resource_id') or self.resource_id
+
+    def describe(self):
+        return f"{self.label} (resource {self.get_resource_id()})"
+
+    def fetch(self):
+        headers = {'content-type': 'application/json'}
+        if self.api_token:
+            headers['authorization'] = self.api_token
+        offset = 0
+        while True:
+            params = {"resource_id": self.get_resource_id(), "limit": self.page_size, "offset": offset}
+            try:
+                resp = requests.get(self.api_url, headers=headers, params=params)
+                resp.raise_for_status()
+                data = resp.json()
+            except requests.exceptions.RequestException as e:
+                raise SourceError(f"API request failed: {e}")
+            if not data.get('success'):
+                raise SourceError(f"API request failed: {data.get('error', {}).get('message', 'Unknown error')}")
+            try:
+                records = data['result']['records']
+            except KeyError:
+                raise SourceError(f"Unexpected API response structure: {data}")
+            self._total_rows = data['result'].get('total', self._total_rows)
+            if records:
+                yield pd.DataFrame(records)
+            if len(records) < self.page_size:  # No more records
+                return
+            offset += self.page_size
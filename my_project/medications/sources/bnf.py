@@ -0,0 +1,43 @@
+# medications/sources/bnf.py
+
+import os
+
+import pandas as pd
+
+from .base import KIND_BNF, DatastoreSourceAdapter
+from .registry import register
+
+
+@register
+class BNFAdapter(DatastoreSourceAdapter):
+    """BNF code and hierarchy release from the NHSBSA open data portal (full bulk fetch)."""
+    name = 'bnf'
+    label = 'BNF Hierarchy'
+    kind = KIND_BNF
+    resource_id = "BNF_CODE_CURRENT_202505_VERSION_88"  # Pass resource_id=... for a newer release
+    # API_TOKEN is usually not required for public datastore_search endpoints
+    api_token = os.environ.get("NHSBSA_API_TOKEN", "")
+    column_map = {
+        'BNF_PRESENTATION_CODE': 'bnf_code_15digit',  # This is the 15-digit code
+        'BNF_CHAPTER_CODE': 'bnf_chapter_code',
+        'BNF_CHAPTER': 'bnf_chapter_name',
+        'BNF_SECTION_CODE': 'bnf_section_code',
+        'BNF_SECTION': 'bnf_section_name',
+        'BNF_PARAGRAPH_CODE': 'bnf_paragraph_code',
+        'BNF_PARAGRAPH': 'bnf_paragraph_name',
+        'BNF_CHEMICAL_SUBSTANCE': 'bnf_chemical_substance',
+        'BNF_PRESENTATION': 'bnf_presentation_description',
+        'YEAR_MONTH': 'bnf_version',  # Using YEAR_MONTH as BNF Version
+    }
+    coercions = {
+        'bnf_code_15digit': 'string',
+        'bnf_chemical_substance': 'string',
+    }
+    required = ('bnf_code_15digit', 'bnf_chemical_substance', 'bnf_presentation_description', 'valid_from_date')
+    key_fields = ('bnf_code_15digit',)
+
+    def resolve_period(self, df):
+        # The release has no validity dates: a version is valid from the first day of its YEAR_MONTH
+        df['valid_from_date'] = pd.to_datetime(df['bnf_version'] + '-01', errors='coerce').dt.date
+        df['valid_to_date'] = None
+        return df
@@ -0,0 +1,111 @@
+# medications/sources/command.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from my_project.db_router import use_primary
+from ..import_diff import format_diff
+from ..jobs import ImportBusyError, import_lock
+from .base import KIND_BNF, DatastoreSourceAdapter, FileSourceAdapter, SourceError
+from .pipeline import format_telemetry, run_import
+from .registry import available_sources, get_adapter
+
+
+class SourceImportCommand(BaseCommand):
+    """Base for import commands: runs a registered source adapter through the shared pipeline.
+
+    Set source_name for a command bound to one source; leave it None to take the source as a
+    positional argument. Options are added for what the source(s) support: --file for file
+    feeds, --resource-id for datastore feeds, --keep-missing/--purge-placeholders for BNF.
+    """
+    source_name = None
+    # Set by the background job runner (medications/jobs.py): progress(processed, total=None, stage=None)
+    stealth_options = ('progress',)
+
+    def execute(self, *args, **options):
+        # Keep every query on the primary so the command reads back what it just wrote
+        with use_primary():
+            return super().execute(*args, **options)
+
+    def _adapter_classes(self):
+        sources = available_sources()
+        return [sources[self.source_name]] if self.source_name else list(sources.values())
+
+    def add_arguments(self, parser):
+        adapter_classes = self._adapter_classes()
+        if self.source_name is None:
+            parser.add_argument('source', choices=list(available_sources()), help='Registered source to import.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Read the source and report what would change, with samples, without writing anything.',
+        )
+        if any(issubclass(adapter, FileSourceAdapter) for adapter in adapter_classes):
+            parser.add_argument('--file', help='Read this file instead of the source\'s default path.')
+        if any(issubclass(adapter, DatastoreSourceAdapter) for adapter in adapter_classes):
+            parser.add_argument('--resource-id', help='Fetch this datastore resource instead of the default release.')
+        if any(adapter.kind == KIND_BNF for adapter in adapter_classes):
+            parser.add_argument(
+                '--keep-missing',
+                action='store_true',
+                help='Do not close out BNF codes that are missing from this release.',
+            )
+            parser.add_argument(
+                '--purge-placeholders',
+                action='store_true',
+                help='After reconciliation, delete placeholder BNF/chemical rows no product references any more.',
+            )
+
+    def get_adapter(self, options):
+        name = self.source_name or options['source']
+        adapter_class = available_sources()[name]
+        adapter_options = {}
+        if options.get('file'):
+            if not issubclass(adapter_class, FileSourceAdapter):
+                raise CommandError(f"--file does not apply to source '{name}'.")
+            adapter_options['path'] = options['file']
+        if options.get('resource_id'):
+            if not issubclass(adapter_class, DatastoreSourceAdapter):
+                raise CommandError(f"--resource-id does not apply to source '{name}'.")
+            adapter_options['resource_id'] = options['resource_id']
+        return get_adapter(name, **adapter_options)
+
+    def get_writer_options(self, adapter, options):
+        if adapter.kind == KIND_BNF:
+            return {'retire_missing': not options['keep_missing'], 'purge_placeholders': options['purge_placeholders']}
+        if options.get('keep_missing') or options.get('purge_placeholders'):
+            raise CommandError(f"--keep-missing/--purge-placeholders only apply to BNF sources, not '{adapter.name}'.")
+        return {}
+
+    def log(self, message, style='notice'):
+        self.stdout.write(getattr(self.style, style.upper())(message))
+
+    def run(self, adapter, options, writer_options):
+        return run_import(
+            adapter, dry_run=options['dry_run'], log=self.log, progress=options.get('progress'), **writer_options,
+        )
+
+    def handle(self, *args, **options):
+        adapter = self.get_adapter(options)
+        writer_options = self.get_writer_options(adapter, options)
+        try:
+            if options['dry_run']:
+                result = self.run(adapter, options, writer_options)  # Read-only: no need to wait for the lock
+            else:
+                # Single flight per source, whether started here, by import_source or by a worker job
+                with import_lock(adapter.name) as acquired:
+                    if not acquired:
+                        raise ImportBusyError(f"Another {adapter.label} import is already running.")
+                    result = self.run(adapter, options, writer_options)
+        except CommandError:
+            raise
+        except SourceError as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            raise CommandError(f"Error during {adapter.label} import: {e}")
+
+        if options['dry_run']:
+            for diff in result['diffs']:
+                for line in format_diff(diff):
+                    self.stdout.write(line)
+            self.log("Dry run: nothing was written.", 'warning')
+        self.log(f"Telemetry: {format_telemetry(result['telemetry'])}")
@@ -0,0 +1,38 @@
+# medications/sources/emit.py
+
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+
+from .base import KIND_PRICING, FileSourceAdapter
+from .registry import register
+
+
+@register
+class EmitAdapter(FileSourceAdapter):
+    """eMIT national database: hospital pricing and usage per NPC code, one annual ODS file."""
+    name = 'emit'
+    label = 'eMIT Hospital Data'
+    kind = KIND_PRICING
+    path = Path(settings.DATA_DIR) / 'emit_national_database.ods'
+    read_options = {'header': 1}  # The 2nd row of the spreadsheet is the header
+    column_map = {
+        'NPC Code': 'npc_code',
+        'Name & PackSize': 'product_name',
+        'Weighted Average Price': 'price_gbp',
+        'Quantity': 'usage_estimate',
+        'Standard Deviation Of Price': 'price_change_measure',
+    }
+    coercions = {
+        'npc_code': 'string',
+        'product_name': 'string',
+        'price_gbp': 'money',
+        'usage_estimate': 'numeric',
+        'price_change_measure': 'numeric',
+    }
+    required = ('npc_code', 'price_gbp')
+    key_fields = ('npc_code',)
+    period_start = date(2023, 7, 1)
+    period_end = date(2024, 6, 30)
+    placeholder_version = 'eMIT Placeholder'
@@ -0,0 +1,149 @@
+# medications/sources/pipeline.py
+
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+
+from ..data_version import bump_data_version
+from ..import_diff import diff_bnf_import, diff_pricing_import
+from ..signals import import_completed
+from .base import KIND_BNF, KIND_PRICING, SourceError
+from .writers import WRITERS
+
+logger = logging.getLogger(__name__)
+
+REJECTED_SAMPLE_SIZE = 3
+
+
+class ImportTelemetry:
+    """Stage timings and row counts for one import run."""
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.counts = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    @contextmanager
+    def consumer_stage(self, name):
+        """Times a step that pulls chunks lazily, excluding the fetch/prepare time it drives."""
+        reading = lambda: self.stages['fetch'] + self.stages['prepare']
+        start, read_before = time.perf_counter(), reading()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start - (reading() - read_before)
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'source': self.adapter.name,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.counts['rows_valid'] / elapsed, 1) if elapsed else None,
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            **self.counts,
+        }
+
+
+def format_telemetry(telemetry):
+    """One-line summary of ImportTelemetry.as_dict(), for command output."""
+    stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in telemetry['stages'].items())
+    return (
+        f"{telemetry.get('rows_fetched', 0)} rows fetched, {telemetry.get('rows_valid', 0)} valid, "
+        f"{telemetry.get('rows_rejected', 0)} rejected in {telemetry['elapsed_seconds']:.2f}s "
+        f"({telemetry['rows_per_second']} rows/s; {stages})"
+    )
+
+
+def _prepared_chunks(adapter, telemetry, log, progress):
+    """Fetches and prepares the source chunk by chunk, timing each step separately from the writer."""
+    raw_chunks = adapter.fetch()
+    while True:
+        with telemetry.stage('fetch'):
+            raw = next(raw_chunks, None)
+        if raw is None:
+            break
+        with telemetry.stage('prepare'):
+            valid, rejected = adapter.prepare(raw)
+        telemetry.counts['chunks'] += 1
+        telemetry.counts['rows_fetched'] += len(raw)
+        telemetry.counts['rows_valid'] += len(valid)
+        telemetry.counts['rows_rejected'] += len(rejected)
+        progress(telemetry.counts['rows_fetched'], total=adapter.total_rows(), stage=f"Importing {adapter.label}")
+        if len(rejected):
+            sample = rejected.reindex(columns=list(adapter.required)).head(REJECTED_SAMPLE_SIZE)
+            log(
+                f"Rejected {len(rejected)} rows missing {', '.join(adapter.required)}, e.g. "
+                f"{sample.astype(object).where(sample.notna(), None).to_dict('records')}", 'warning',
+            )
+        if len(valid):
+            yield valid
+    if not telemetry.counts['rows_fetched']:
+        raise SourceError(f"No records fetched from {adapter.describe()}.")
+    log(f"Finished reading {telemetry.counts['rows_fetched']} rows from {adapter.describe()}.", 'success')
+
+
+def _dry_run(adapter, chunks, key, retire_missing=True, purge_placeholders=False):
+    frames = list(chunks)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(adapter.required))
+    if adapter.kind == KIND_PRICING:
+        return diff_pricing_import(df, source=adapter.label, key=key)
+    if adapter.kind == KIND_BNF:
+        return diff_bnf_import(df, retire_missing=retire_missing, purge_placeholders=purge_placeholders)
+    raise ValueError(f"{adapter!r}: no dry run for kind '{adapter.kind}'")
+
+
+def run_import(adapter, dry_run=False, log=None, progress=None, **writer_options):
+    """Runs one adapter through fetch -> prepare -> write, then bumps the data version.
+
+    writer_options go to the kind's writer (e.g. retire_missing, purge_placeholders for BNF).
+    With dry_run, the prepared rows are diffed against the database instead and nothing is
+    written. Returns {'diffs' or 'summary', 'data_version', 'telemetry'}.
+    """
+    log = log or (lambda message, style='notice': logger.info(message))
+    progress = progress or (lambda *args, **kwargs: None)
+    if adapter.kind not in WRITERS:
+        raise ValueError(f"{adapter!r}: unknown kind '{adapter.kind}'")
+    key = WRITERS[adapter.kind].key_field(adapter)  # A misdeclared key fails before anything is read
+
+    telemetry = ImportTelemetry(adapter)
+    log(f"Starting import from {adapter.describe()}", 'success')
+    chunks = _prepared_chunks(adapter, telemetry, log, progress)
+
+    if dry_run:
+        # Reads each table once and diffs in memory; no transaction, no writes, no version bump
+        with telemetry.consumer_stage('diff'):
+            diffs = _dry_run(adapter, chunks, key, **writer_options)
+        result = {'diffs': diffs, 'data_version': None}
+    else:
+        writer = WRITERS[adapter.kind](adapter, log=log, progress=progress, **writer_options)
+        with telemetry.consumer_stage('write'):
+            summary = writer.write(chunks)
+
+        # Invalidate caches and reports derived from the previous data
+        data_version = bump_data_version()
+        log(f"Data version is now {data_version}.")
+        with telemetry.stage('post_import'):
+            # The import is committed by now: a failing receiver (snapshot, cache) is reported, never re-raised.
+            # send_robust already logs the traceback on the django.dispatch logger.
+            responses = import_completed.send_robust(sender=adapter.__class__, source=adapter.name, data_version=data_version)
+        for receiver, response in responses:
+            if isinstance(response, Exception):
+                telemetry.counts['post_import_failures'] += 1
+                log(f"Post-import step {receiver.__name__} failed: {response}", 'warning')
+        result = {'summary': summary, 'data_version': data_version}
+
+    result['telemetry'] = telemetry.as_dict()
+    logger.info("Import from %s%s: %s", adapter.name, " (dry run)" if dry_run else "", result['telemetry'])
+    return result
@@ -0,0 +1,26 @@
+# medications/sources/registry.py
+
+_adapters = {}
+
+
+def register(adapter_class):
+    """Class decorator that makes an adapter available to import_source under its `name`."""
+    if not adapter_class.name:
+        raise ValueError(f"{adapter_class.__name__} needs a name to be registered.")
+    if adapter_class.name in _adapters and _adapters[adapter_class.name] is not adapter_class:
+        raise ValueError(f"A source named '{adapter_class.name}' is already registered.")
+    _adapters[adapter_class.name] = adapter_class
+    return adapter_class
+
+
+def get_adapter(name, **options):
+    """Instantiates the registered adapter `name` with per-run options (e.g. path, resource_id)."""
+    try:
+        adapter_class = _adapters[name]
+    except KeyError:
+        raise ValueError(f"Unknown import source '{name}'. Choose from: {', '.join(sorted(_adapters))}")
+    return adapter_class(**options)
+
+
+def available_sources():
+    return dict(sorted(_adapters.items()))
@@ -0,0 +1,249 @@
+# medications/sources/writers.py
+
+import pandas as pd
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+
+from ..bnf_versioning import CONTENT_FIELDS, apply_versioned_import
+from ..bulk_load import bulk_load
+from ..cleanup import PLACEHOLDER_BNF_PREFIX, PLACEHOLDER_CHEMICAL_PREFIX, purge_orphaned_placeholders
+from ..models import BNFHierarchy, ChemicalComposition, MedicationPricingHistory, MedicationProduct
+from ..reference_cache import get_reference_cache
+from .base import KIND_BNF, KIND_PRICING, SourceError
+
+LOOKUP_CHUNK_SIZE = 5000  # Product codes per IN (...) list when resolving product ids
+
+
+class PricingWriter:
+    """Loads a pricing feed chunk by chunk inside one transaction.
+
+    Products are identified by the adapter's key field, one unique MedicationProduct field
+    (npc_code for eMIT). Per chunk: placeholder chemical/BNF rows for products seen for the first
+    time, a product upsert on the key (name and latest price updated), then the pricing history
+    rows, which are append-only. Product ids are kept in a per-run dict: codes the reference
+    cache knows come from it, the rest are looked up in chunked IN (...) queries, once before and
+    once after their insert. The shared cache is only reloaded after commit, by import_completed.
+    """
+    columns = ('product_name', 'price_gbp', 'period_start', 'period_end')  # Besides the key
+    key_labels = {'npc_code': 'NPC Code'}  # For placeholder descriptions
+
+    def __init__(self, adapter, log, progress):
+        self.adapter = adapter
+        self.log = log
+        self.progress = progress
+        self.key = self.key_field(adapter)
+        self.product_ids = {}
+        self.references = None
+
+    @classmethod
+    def key_field(cls, adapter):
+        """The MedicationProduct field named by the adapter's key_fields; it must be one unique field."""
+        key_fields = tuple(adapter.key_fields)
+        try:
+            field = MedicationProduct._meta.get_field(key_fields[0]) if len(key_fields) == 1 else None
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.unique or field.is_relation:
+            raise SourceError(
+                f"{adapter.label}: pricing sources are keyed on one unique MedicationProduct field, not {key_fields}"
+            )
+        return field.name
+
+    def _lookup_product_ids(self, codes):
+        """Adds the ids of the existing products among `codes` to self.product_ids."""
+        missing = [code for code in dict.fromkeys(codes) if code not in self.product_ids]
+        if self.references is not None:
+            # The cache can lag an import in another process by a few seconds, so only its hits are trusted
+            cached = {code: self.references.product_id(code) for code in missing}
+            self.product_ids.update((code, pk) for code, pk in cached.items() if pk is not None)
+            missing = [code for code, pk in cached.items() if pk is None]
+        for start in range(0, len(missing), LOOKUP_CHUNK_SIZE):
+            self.product_ids.update(
+                MedicationProduct.objects.filter(**{f"{self.key}__in": missing[start:start + LOOKUP_CHUNK_SIZE]})
+                .values_list(self.key, 'id')
+            )
+
+    def _write_chunk(self, df):
+        key = self.key
+        # If the feed lists a product twice, the last row wins
+        products_df = df.drop_duplicates(subset=[key], keep='last')
+        self._lookup_product_ids(products_df[key].tolist())
+        is_new = ~products_df[key].isin(self.product_ids.keys())
+        new_products = products_df[is_new]
+
+        # --- Placeholder chemicals and BNF entries, only for products that don't exist yet ---
+        chemical_names = PLACEHOLDER_CHEMICAL_PREFIX + new_products[key]
+        key_label = self.key_labels.get(key, MedicationProduct._meta.get_field(key).verbose_name)
+        bulk_load(pd.DataFrame({
+            'chemical_name': chemical_names,
+            'chemical_description': f"Placeholder for {key_label} " + new_products[key],
+        }), ChemicalComposition, conflict_fields=['chemical_name'])
+        placeholders = bulk_load(pd.DataFrame({
+            'bnf_code_15digit': PLACEHOLDER_BNF_PREFIX + new_products[key],
+            'bnf_chapter_code': 'XX',
+            'bnf_chapter_name': 'Placeholder Chapter',
+            'bnf_section_code': 'XXXXX',
+            'bnf_section_name': 'Placeholder Section',
+            'bnf_paragraph_code': 'XXXXXXX',
+            'bnf_paragraph_name': 'Placeholder Paragraph',
+            'bnf_chemical_substance': chemical_names,
+            'bnf_presentation_description': new_products['product_name'],
+            'bnf_version': self.adapter.get_placeholder_version(),
+            'valid_from_date': new_products['period_start'],
+            'valid_to_date': None,
+        }), BNFHierarchy, conflict_fields=['bnf_code_15digit'])
+
+        # --- Products: new ones get placeholder links, existing ones get name and price updated ---
+        bulk_load(pd.DataFrame({
+            key: products_df[key],
+            'product_name': products_df['product_name'],
+            'bnf_code_15digit_id': (PLACEHOLDER_BNF_PREFIX + products_df[key]).where(is_new, None),
+            'chemical_name_id': (PLACEHOLDER_CHEMICAL_PREFIX + products_df[key]).where(is_new, None),
+            'latest_average_price_gbp': products_df['price_gbp'],
+        }), MedicationProduct, conflict_fields=[key],
+            update_fields=['product_name', 'latest_average_price_gbp'])
+        self._lookup_product_ids(new_products[key].tolist())
+
+        # --- Pricing history, one row per feed row ---
+        prices = bulk_load(pd.DataFrame({
+            'product_id': df[key].map(self.product_ids),
+            'source': self.adapter.label,
+            'price_gbp': df['price_gbp'],
+            'period_start': df['period_start'],
+            'period_end': df['period_end'],
+            'usage_estimate': df.get('usage_estimate'),
+            'price_change_measure': df.get('price_change_measure'),
+        }), MedicationPricingHistory)
+        return {'placeholder_bnf_entries': placeholders, 'new_products': int(is_new.sum()), 'pricing_rows': prices}
+
+    def write(self, chunks):
+        totals = {'placeholder_bnf_entries': 0, 'new_products': 0, 'pricing_rows': 0}
+        # Taken before the transaction opens, so the shared cache never holds rows this run hasn't committed
+        self.references = get_reference_cache() if self.key == 'npc_code' else None
+        with transaction.atomic():
+            for df in chunks:
+                # Chunks are written as they are read, so the pipeline's read progress covers this
+                for key, count in self._write_chunk(df).items():
+                    totals[key] += count
+        self.log(f"Wrote {totals['placeholder_bnf_entries']} placeholder BNF entries.")
+        self.log(
+            f"Import complete! Imported {totals['new_products']} new products and "
+            f"{totals['pricing_rows']} pricing records.", 'success',
+        )
+        return totals
+
+
+class BNFWriter:
+    """Loads a BNF release: chemicals, type-2 versioned hierarchy, then product reconciliation.
+
+    BNF sources are always keyed on bnf_code_15digit, the BNFHierarchy primary key that versions
+    are tracked by. Versioning needs the whole release (codes missing from it are retired), so
+    chunks are gathered before anything is written.
+    """
+    columns = tuple(CONTENT_FIELDS) + ('bnf_version', 'valid_from_date')  # Besides the key; versioning sets valid_to_date
+    key_fields = ('bnf_code_15digit',)
+
+    @classmethod
+    def key_field(cls, adapter):
+        if tuple(adapter.key_fields) != cls.key_fields:
+            raise SourceError(f"{adapter.label}: BNF sources are keyed on {cls.key_fields}, not {tuple(adapter.key_fields)}")
+        return cls.key_fields[0]
+
+    def __init__(self, adapter, log, progress, retire_missing=True, purge_placeholders=False):
+        self.key_field(adapter)
+        self.adapter = adapter
+        self.log = log
+        self.progress = progress
+        self.retire_missing = retire_missing
+        self.purge_placeholders = purge_placeholders
+
+    def _import_hierarchy(self, df):
+        self.log("Importing BNF Hierarchy and Chemical Compositions...")
+        self.progress(0, total=len(df), stage='Importing BNF hierarchy')
+        existing_chemicals = ChemicalComposition.objects.count()
+        with transaction.atomic():
+            chemicals = df['bnf_chemical_substance'].drop_duplicates()
+            bulk_load(pd.DataFrame({
+                'chemical_name': chemicals,
+                'chemical_description': 'From BNF API: ' + chemicals,
+            }), ChemicalComposition, conflict_fields=['chemical_name'])
+
+            # Type-2 versioning: only codes whose content changed are closed out and re-inserted
+            version_counts = apply_versioned_import(df, retire_missing=self.retire_missing)
+        imported_chemicals = ChemicalComposition.objects.count() - existing_chemicals
+        self.progress(len(df))
+        self.log(
+            f"BNF Import complete! Imported {imported_chemicals} new chemicals. BNF hierarchy: "
+            f"{version_counts['new']} new, {version_counts['changed']} changed, "
+            f"{version_counts['unchanged']} unchanged, {version_counts['retired']} retired.", 'success',
+        )
+        return {'new_chemicals': imported_chemicals, **version_counts}
+
+    def _reconcile(self):
+        """Relinks placeholder-linked products to the BNF entry whose presentation matches their name."""
+        self.log("Attempting to reconcile existing eMIT products with BNF data...")
+        # One load of the reference data (now including this release) replaces two queries per product
+        references = get_reference_cache(refresh=True)
+        emit_products = MedicationProduct.objects.filter(
+            npc_code__isnull=False,
+            bnf_code_15digit__bnf_code_15digit__startswith=PLACEHOLDER_BNF_PREFIX,  # Filter for placeholder BNF links
+        ).only('id', 'npc_code', 'product_name', 'bnf_code_15digit', 'chemical_name')
+
+        reconciled_products = []
+        self.progress(0, total=emit_products.count(), stage='Reconciling products')
+        for checked, product in enumerate(emit_products.iterator(chunk_size=2000), start=1):
+            self.progress(checked)
+            # Case-insensitive exact match of the product name against the presentation description.
+            # Placeholders are not in the index, otherwise a product would just match its own placeholder.
+            matching_code = references.bnf_code_for_presentation(product.product_name)
+            if not matching_code:
+                self.log(
+                    f"Could not reconcile NPC {product.npc_code} ('{product.product_name}') with any BNF entry "
+                    f"by exact name match.", 'warning',
+                )
+                continue
+
+            chemical = references.chemical_substance(matching_code)
+            product.bnf_code_15digit_id = matching_code
+            if references.chemical_id(chemical) is not None:
+                product.chemical_name_id = chemical
+            else:
+                self.log(
+                    f"Chemical '{chemical}' of BNF {matching_code} is unknown; keeping NPC {product.npc_code}'s "
+                    f"current chemical.", 'warning',
+                )
+            reconciled_products.append(product)
+            self.log(
+                f"Reconciled NPC {product.npc_code} ('{product.product_name}') with BNF {matching_code}", 'success',
+            )
+
+        MedicationProduct.objects.bulk_update(reconciled_products, ['bnf_code_15digit', 'chemical_name'], batch_size=1000)
+        self.log(
+            f"Reconciliation complete! Reconciled {len(reconciled_products)} eMIT products with BNF data.", 'success',
+        )
+        return len(reconciled_products)
+
+    def write(self, chunks):
+        frames = list(chunks)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if df.empty:
+            raise ValueError(f"No valid rows in {self.adapter.describe()}.")
+
+        summary = self._import_hierarchy(df)
+        summary['reconciled_products'] = self._reconcile()
+
+        # Optionally drop placeholders that reconciliation left unreferenced
+        if self.purge_placeholders:
+            deleted = purge_orphaned_placeholders()
+            self.log(
+                f"Purged {deleted['bnf_entries']} orphaned placeholder BNF entries "
+                f"and {deleted['chemicals']} placeholder chemicals.", 'success',
+            )
+            summary['purged'] = deleted
+        return summary
+
+
+WRITERS = {
+    KIND_PRICING: PricingWriter,
+    KIND_BNF: BNFWriter,
+}
@@ -1,3 +1,661 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from my_project.db_router import PRIMARY_DB_ALIAS, PrimaryReplicaRouter, use_primary
+from .bnf_versioning import apply_versioned_import, content_hash, row_content_hash
+from .bulk_load import bulk_load
+from .cleanup import count_orphaned_placeholders, purge_orphaned_placeholders
+from .dashboard import find_snapshot_page, write_dashboard_snapshot
+from .data_version import bump_data_version
+from .import_diff import diff_bnf_import, diff_pricing_import
+from .jobs import (
+    ProgressReporter, _progress_file_path, _write_progress, fail_stale_jobs, import_lock, run_job,
+    with_live_progress,
+)
+from .models import (
+    BNFHierarchy, BNFHierarchyVersion, ChemicalComposition, ImportJob, MedicationPricingHistory, MedicationProduct,
+)
+from .portfolio import parse_portfolio, parse_substitutions, price_portfolio
+from .pricing_trends import build_price_change_report, build_price_series, compute_price_trends
+from .reference_cache import get_reference_cache, invalidate_reference_cache, reference_cache_stats
+from .sources.base import SourceError
+from .sources.pipeline import run_import
+
+
+EMIT_HEADER = ['NPC Code', 'Name & PackSize', 'Weighted Average Price', 'Quantity', 'Standard Deviation Of Price']
+
+
+def emit_csv(test, rows):
+    """Writes an eMIT-layout CSV (title row, then header) and returns its path; removed after the test."""
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w') as f:
+        f.write('eMIT national database\n')
+        pd.DataFrame(rows, columns=EMIT_HEADER).to_csv(f, index=False)
+    test.addCleanup(os.remove, path)
+    return path
+
+
+def seed_prices(npc_code, prices, source='eMIT Hospital Data', name=None):
+    """Creates a product with one yearly price per value in `prices` (oldest first), starting 2021."""
+    product = MedicationProduct.objects.create(npc_code=npc_code, product_name=name or f"Product {npc_code}")
+    MedicationPricingHistory.objects.bulk_create(
+        MedicationPricingHistory(
+            product=product, source=source, price_gbp=price,
+            period_start=date(2021 + year, 7, 1), period_end=date(2022 + year, 6, 30),
+        )
+        for year, price in enumerate(prices)
+    )
+    return product
+
+
+def bnf_frame(rows, valid_from=date(2025, 5, 1)):
+    """Prepared BNF release frame from (code, presentation, section_name) tuples."""
+    return pd.DataFrame([{
+        'bnf_code_15digit': code,
+        'bnf_chapter_code': code[:2],
+        'bnf_chapter_name': f"Chapter {code[:2]}",
+        'bnf_section_code': code[:4],
+        'bnf_section_name': section,
+        'bnf_paragraph_code': code[:6],
+        'bnf_paragraph_name': 'Paragraph',
+        'bnf_chemical_substance': f"Chemical {code[-3:]}",
+        'bnf_presentation_description': presentation,
+        'bnf_version': valid_from.strftime('%Y-%m'),
+        'valid_from_date': valid_from,
+        'valid_to_date': None,
+    } for code, presentation, section in rows])
+
+
+# --- Price trends (user-026) ---
+class PriceSeriesTests(SimpleTestCase):
+    def test_duplicate_periods_are_averaged_and_gaps_are_nan(self):
+        df = pd.DataFrame({
+            'product_id': [2, 1, 1, 1],
+            'period_start': [date(2021, 7, 1), date(2021, 7, 1), date(2021, 7, 1), date(2023, 7, 1)],
+            'price_gbp': [5.0, 2.0, 4.0, None],
+            'usage_estimate': [1.0, None, 10.0, 3.0],
+        })
+        series = build_price_series(df)
+        self.assertEqual(series.product_ids.tolist(), [1, 2])
+        self.assertEqual(len(series.periods), 2)
+        self.assertEqual(series.prices[0, 0], 3.0)
+        self.assertTrue(np.isnan(series.prices[0, 1]))
+        self.assertTrue(np.isnan(series.prices[1, 1]))
+        self.assertEqual(series.usage[0].tolist(), [10.0, 3.0])
+
+    def test_changes_skip_gaps_and_weight_by_usage(self):
+        series = build_price_series(pd.DataFrame({
+            'product_id': [1, 1, 1],
+            'period_start': [date(2021, 7, 1), date(2022, 7, 1), date(2024, 7, 1)],
+            'price_gbp': [10.0, 12.0, 9.0],
+            'usage_estimate': [1.0, 3.0, None],
+        }))
+        trends = compute_price_trends(series, window=3)
+        self.assertEqual(trends['latest_price'][0], 9.0)
+        self.assertEqual(trends['latest_abs_change'][0], -3.0)  # Against 2022, the last observed price
+        self.assertAlmostEqual(trends['latest_pct_change'][0], -0.25)
+        self.assertAlmostEqual(trends['usage_weighted_price'][0], 11.5)  # (10*1 + 12*3) / 4
+        self.assertAlmostEqual(trends['latest_volatility'][0], np.std([0.2, -0.25], ddof=1))
+
+
+class PriceChangeReportTests(TestCase):
+    def test_movers_are_ranked_by_latest_change(self):
+        seed_prices('A1', [10, 11])
+        seed_prices('A2', [10, 5])
+        seed_prices('A3', [10])
+        seed_prices('B1', [1, 100], source='Other feed')
+        report = build_price_change_report(top_n=5)
+        self.assertEqual(report['product_count'], 3)
+        self.assertEqual([mover['npc_code'] for mover in report['movers']], ['A2', 'A1'])
+        self.assertEqual(report['movers'][0]['change_pct'], -50.0)
+
+
+# --- Bulk loader (user-027) ---
+class BulkLoadTests(TestCase):
+    def test_upsert_updates_listed_fields_and_last_duplicate_wins(self):
+        MedicationProduct.objects.create(npc_code='A1', product_name='Old', latest_average_price_gbp=1)
+        written = bulk_load(pd.DataFrame({
+            'npc_code': ['A1', 'A2', 'A2'],
+            'product_name': ['New', 'Beta', 'Beta v2'],
+            'latest_average_price_gbp': [2.5, None, 3],
+        }), MedicationProduct, conflict_fields=['npc_code'], update_fields=['product_name'], chunk_size=1)
+        self.assertEqual(written, 2)
+        self.assertEqual(
+            sorted(MedicationProduct.objects.values_list('npc_code', 'product_name', 'latest_average_price_gbp')),
+            [('A1', 'New', 1), ('A2', 'Beta v2', 3)],  # A1's price is not in update_fields
+        )
+
+    def test_conflicts_are_skipped_without_update_fields(self):
+        ChemicalComposition.objects.create(chemical_name='Alpha', chemical_description='kept')
+        bulk_load(pd.DataFrame({'chemical_name': ['Alpha', 'Beta'], 'chemical_description': ['new', None]}),
+                  ChemicalComposition, conflict_fields=['chemical_name'])
+        self.assertEqual(
+            dict(ChemicalComposition.objects.values_list('chemical_name', 'chemical_description')),
+            {'Alpha': 'kept', 'Beta': None},
+        )
+
+    def test_plain_insert_with_foreign_key_attnames_and_progress(self):
+        product = MedicationProduct.objects.create(npc_code='A1')
+        sent = []
+        bulk_load(pd.DataFrame({
+            'product_id': [product.id] * 3,
+            'source': 'Feed',
+            'price_gbp': [1, 2, 3],
+            'period_start': [date(2024, 7, 1)] * 3,
+            'period_end': [date(2025, 6, 30)] * 3,
+            'usage_estimate': [5, float('nan'), None],
+        }), MedicationPricingHistory, chunk_size=2, progress=sent.append)
+        self.assertEqual(sent, [2, 3])
+        self.assertEqual(
+            list(product.pricing_history.order_by('pk').values_list('price_gbp', 'usage_estimate')),
+            [(1, 5), (2, None), (3, None)],  # NaN is written as NULL
+        )
+
+    def test_rejects_unknown_columns(self):
+        with self.assertRaisesMessage(ValueError, 'no concrete field with attname'):
+            bulk_load(pd.DataFrame({'product': [1]}), MedicationPricingHistory)
+
+
+# --- BNF versioning (user-028) ---
+class ContentHashTests(TestCase):
+    def test_hash_is_pinned_to_the_row_text(self):
+        # A stored hash must never change with a library upgrade, so the algorithm is pinned here
+        self.assertEqual(row_content_hash(['01', 'Gastro', None]), row_content_hash(['01', 'Gastro', '']))
+        self.assertEqual(row_content_hash(['a', 'b']), 'f84c4d669fe0d410')
+
+    def test_frame_hash_matches_row_hash_and_ignores_metadata(self):
+        df = bnf_frame([('0101010A0AAAAAA', 'Alpha 5mg', 'Dyspepsia')])
+        later = df.assign(bnf_version='2025-06', valid_from_date=date(2025, 6, 1))
+        self.assertEqual(content_hash(df).tolist(), content_hash(later).tolist())
+        self.assertEqual(len(content_hash(df)[0]), 16)
+
+
+class VersionedImportTests(TestCase):
+    def test_unchanged_release_writes_nothing_and_changes_open_new_versions(self):
+        first = bnf_frame([('0101010A0AAAAAA', 'Alpha', 'Dyspepsia'), ('0101010B0AAAAAA', 'Gamma', 'Dyspepsia')])
+        self.assertEqual(apply_versioned_import(first), {'new': 2, 'changed': 0, 'unchanged': 0, 'retired': 0})
+        self.assertEqual(apply_versioned_import(first)['unchanged'], 2)
+
+        second = bnf_frame([('0101010A0AAAAAA', 'Alpha', 'Antacids')], valid_from=date(2025, 6, 1))
+        counts = apply_versioned_import(second)
+        self.assertEqual(counts, {'new': 0, 'changed': 1, 'unchanged': 0, 'retired': 1})
+
+        versions = BNFHierarchyVersion.objects.filter(bnf_code_15digit='0101010A0AAAAAA').order_by('valid_from_date')
+        self.assertEqual([(v.bnf_section_name, v.valid_to_date) for v in versions],
+                         [('Dyspepsia', date(2025, 6, 1)), ('Antacids', None)])
+        self.assertEqual(BNFHierarchy.objects.get(pk='0101010B0AAAAAA').valid_to_date, date(2025, 6, 1))
+        self.assertEqual(BNFHierarchyVersion.objects.as_of(date(2025, 5, 15)).count(), 2)
+
+    def test_keep_missing_leaves_absent_codes_open(self):
+        apply_versioned_import(bnf_frame([('0101010A0AAAAAA', 'Alpha', 'S'), ('0101010B0AAAAAA', 'Gamma', 'S')]))
+        counts = apply_versioned_import(bnf_frame([('0101010A0AAAAAA', 'Alpha', 'S')]), retire_missing=False)
+        self.assertEqual(counts['retired'], 0)
+        self.assertEqual(BNFHierarchyVersion.objects.current().count(), 2)
+
+
+class MigrateFreshDatabaseTests(TransactionTestCase):
+    """Migrations must read and write the database being migrated, never the read replica."""
+
+    def test_backfill_migration_ignores_read_routing(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('medications', '0005_dataversion')])
+        old_apps = executor.loader.project_state([('medications', '0005_dataversion')]).apps
+        row = bnf_frame([('0101010A0AAAAAA', 'Alpha', 'Dyspepsia')]).iloc[0].drop('valid_to_date').to_dict()
+        old_apps.get_model('medications', 'BNFHierarchy').objects.create(**row)
+
+        # Every routed read would hit an alias that doesn't exist
+        with mock.patch('my_project.db_router.read_replica_alias', return_value='unmigrated'):
+            executor = MigrationExecutor(connection)
+            executor.loader.build_graph()
+            executor.migrate(executor.loader.graph.leaf_nodes('medications'))
+
+        version = BNFHierarchyVersion.objects.get()
+        self.assertEqual(version.bnf_code_15digit, '0101010A0AAAAAA')
+        # Seeded with the import's own hash: re-importing the same release touches nothing
+        self.assertEqual(version.content_hash, content_hash(bnf_frame([('0101010A0AAAAAA', 'Alpha', 'Dyspepsia')]))[0])
+        self.assertEqual(apply_versioned_import(bnf_frame([('0101010A0AAAAAA', 'Alpha', 'Dyspepsia')]))['unchanged'], 1)
+
+    def test_migrate_command_runs(self):
+        with mock.patch('my_project.db_router.read_replica_alias', return_value='unmigrated'):
+            call_command('migrate', 'medications', '0005_dataversion', verbosity=0)
+            call_command('migrate', 'medications', verbosity=0)
+        self.assertTrue(BNFHierarchyVersion.objects.model._meta.db_table in connection.introspection.table_names())
+
+
+# --- Placeholder cleanup (user-029) ---
+class PurgePlaceholderTests(TestCase):
+    def placeholder(self, npc_code):
+        chemical = ChemicalComposition.objects.create(chemical_name=f"CHEM_NPC_{npc_code}")
+        bnf = BNFHierarchy.objects.create(bnf_code_15digit=f"BNF_NPC_{npc_code}", bnf_chemical_substance=chemical.chemical_name)
+        return bnf, chemical
+
+    def test_purges_only_unreferenced_placeholders_without_the_collector(self):
+        for code in ('A1', 'A2', 'A3'):
+            self.placeholder(code)
+        bnf, chemical = self.placeholder('K1')
+        MedicationProduct.objects.create(npc_code='K1', bnf_code_15digit=bnf, chemical_name=chemical)
+        self.assertEqual(count_orphaned_placeholders(), {'bnf_entries': 3, 'chemicals': 3})
+
+        # Per table: two batches of (select keys, one DELETE) and a final empty select. The Collector
+        # would add a row fetch and a protected-relation check per batch.
+        with CaptureQueriesContext(connection) as queries:
+            deleted = purge_orphaned_placeholders(batch_size=2)
+        self.assertEqual(deleted, {'bnf_entries': 3, 'chemicals': 3})
+        self.assertEqual(len(queries), 10)
+        self.assertEqual(sum(query['sql'].startswith('DELETE') for query in queries.captured_queries), 4)
+        self.assertEqual(list(BNFHierarchy.objects.values_list('pk', flat=True)), ['BNF_NPC_K1'])
+        self.assertEqual(list(ChemicalComposition.objects.values_list('chemical_name', flat=True)), ['CHEM_NPC_K1'])
+
+
+# --- Read replica routing (user-030) ---
+@mock.patch('my_project.db_router.read_replica_alias', return_value='replica')
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_the_replica_unless_pinned(self, _alias):
+        self.assertEqual(self.router.db_for_read(MedicationProduct), 'replica')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(MedicationProduct), PRIMARY_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(MedicationProduct), PRIMARY_DB_ALIAS)
+
+    def test_migrations_run_on_the_primary_only(self, _alias):
+        self.assertTrue(self.router.allow_migrate(PRIMARY_DB_ALIAS, 'medications'))
+        self.assertFalse(self.router.allow_migrate('replica', 'medications'))
+
+
+# --- Background import jobs and single-flight locking (user-031) ---
+class ImportLockTests(TestCase):
+    def test_lock_is_exclusive_per_source(self):
+        with import_lock('emit') as first:
+            self.assertTrue(first)
+            with import_lock('emit') as second, import_lock('bnf') as other:
+                self.assertFalse(second)
+                self.assertTrue(other)
+        with import_lock('emit') as again:
+            self.assertTrue(again)
+
+    def test_manual_import_refuses_to_run_while_locked(self):
+        path = emit_csv(self, [['A1', 'Alpha', 1.5, 10, 0.1]])
+        with import_lock('emit'):
+            with self.assertRaisesMessage(CommandError, 'already running'):
+                call_command('import_source', 'emit', file=path, stdout=io.StringIO())
+            # A dry run only reads, so it doesn't wait for the lock
+            call_command('import_emit_data', file=path, dry_run=True, stdout=io.StringIO())
+        self.assertFalse(MedicationProduct.objects.exists())
+
+    def test_job_goes_back_to_the_queue_while_a_manual_import_runs(self):
+        job = ImportJob.objects.create(source=ImportJob.SOURCE_EMIT)
+        with import_lock('emit'):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.started_at, job.worker), (ImportJob.STATUS_QUEUED, None, ''))
+
+
+class StaleJobTests(TestCase):
+    def test_sqlite_jobs_are_stale_only_when_their_worker_process_is_gone(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        host = socket.gethostname()
+        alive = ImportJob.objects.create(source=ImportJob.SOURCE_EMIT, status=ImportJob.STATUS_RUNNING,
+                                         heartbeat_at=long_ago, worker=f"{host}:{os.getpid()}")
+        dead = ImportJob.objects.create(source=ImportJob.SOURCE_BNF, status=ImportJob.STATUS_RUNNING,
+                                        heartbeat_at=long_ago, worker=f"{host}:999999999")
+        self.assertEqual(fail_stale_jobs(), 1)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((alive.status, dead.status), (ImportJob.STATUS_RUNNING, ImportJob.STATUS_FAILED))
+
+
+class SQLiteJobProgressTests(TestCase):
+    def test_running_job_shows_progress_written_beside_the_database(self):
+        job = ImportJob.objects.create(source=ImportJob.SOURCE_EMIT, status=ImportJob.STATUS_RUNNING,
+                                       started_at=timezone.now() - timedelta(seconds=10))
+        self.addCleanup(_progress_file_path(job.pk).unlink, missing_ok=True)
+        reporter = ProgressReporter()
+        reporter(250, total=1000, stage='Importing EMIT')
+        _write_progress(job, reporter)
+
+        job.refresh_from_db()
+        self.assertEqual(job.processed_rows, 0)  # The row is left alone while the import holds the write lock
+        from django.contrib.auth import get_user_model
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        status = self.client.get(reverse('import_job_api', args=[job.pk])).json()
+        self.assertEqual((status['processed_rows'], status['total_rows'], status['stage']), (250, 1000, 'Importing EMIT'))
+        self.assertIsNotNone(status['eta_seconds'])
+
+    def test_progress_left_by_an_earlier_job_is_ignored(self):
+        job = ImportJob.objects.create(source=ImportJob.SOURCE_EMIT, status=ImportJob.STATUS_RUNNING,
+                                       started_at=timezone.now())
+        self.addCleanup(_progress_file_path(job.pk).unlink, missing_ok=True)
+        _progress_file_path(job.pk).write_text(json.dumps({
+            'processed_rows': 5, 'heartbeat_at': (job.started_at - timedelta(hours=1)).isoformat(),
+        }))
+        self.assertEqual(with_live_progress(job).processed_rows, 0)
+
+
+# --- Admin on large tables (user-032) ---
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.url = reverse('admin:medications_medicationpricinghistory_changelist')
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        seed_prices('A1', [1, 2])
+        self.changelist_queries()  # Warms the session and the cached filter choices
+        _, few = self.changelist_queries()
+        for n in range(10):
+            seed_prices(f"B{n}", [1, 2, 3])
+        _, many = self.changelist_queries()
+        self.assertEqual(few, many)
+
+    def test_search_is_a_prefix_match(self):
+        seed_prices('AB1', [1])
+        seed_prices('XAB', [2])
+        response, _ = self.changelist_queries(q='AB')
+        self.assertEqual([price.product.npc_code for price in response.context['cl'].result_list], ['AB1'])
+
+
+# --- Post-import hooks and analytics snapshots (user-033) ---
+@override_settings(ANALYTICS_SNAPSHOT_ON_IMPORT=False, DASHBOARD_SNAPSHOT_ON_IMPORT=True)
+class ImportCompletedFailureTests(TestCase):
+    def test_failing_receiver_does_not_fail_the_committed_import(self):
+        path = emit_csv(self, [['A1', 'Alpha 5mg', 2.5, 10, 0.1]])
+        out = io.StringIO()
+        with mock.patch('medications.dashboard.write_dashboard_snapshot', side_effect=OSError('disk full')):
+            call_command('import_emit_data', file=path, stdout=out)
+        self.assertEqual(MedicationProduct.objects.get(npc_code='A1').product_name, 'Alpha 5mg')
+        self.assertIn('Post-import step render_dashboard_snapshot failed: disk full', out.getvalue())
+
+
+class AnalyticsSnapshotTests(TransactionTestCase):
+    def test_snapshot_rows_and_producer_thread_connection_is_closed(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        from .analytics import load_snapshot_frame, write_snapshot
+
+        seed_prices('A1', [4, 5])
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        closed_on = []
+        original_close = DatabaseWrapper.close
+
+        def close(wrapper):
+            closed_on.append(threading.get_ident())
+            original_close(wrapper)
+
+        with mock.patch.object(DatabaseWrapper, 'close', close):
+            manifest = write_snapshot(root=root)
+        self.assertEqual(manifest['row_count'], 2)
+        self.assertEqual(sorted(load_snapshot_frame(['price_gbp'], root=root)['price_gbp']), [4.0, 5.0])
+        self.assertTrue(closed_on)
+        self.assertNotIn(threading.get_ident(), closed_on)
+
+
+# --- Dashboard snapshot (user-034) ---
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        invalidate_reference_cache()
+        self.addCleanup(invalidate_reference_cache)
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        snapshot_dir = self.settings(DASHBOARD_SNAPSHOT_DIR=root)
+        snapshot_dir.enable()
+        self.addCleanup(snapshot_dir.disable)
+        apply_versioned_import(bnf_frame([('0101010A0AAAAAA', 'Alpha 5mg', 'Dyspepsia')]))
+        bnf = BNFHierarchy.objects.get(pk='0101010A0AAAAAA')
+        seed_prices('A1', [4], name='Alpha snapshot product')
+        MedicationProduct.objects.filter(npc_code='A1').update(bnf_code_15digit=bnf)
+
+    def test_snapshot_is_served_precompressed_until_the_next_import(self):
+        summary = write_dashboard_snapshot()
+        self.assertEqual((summary['scopes'], summary['pages']), (2, 2))  # All products, chapter 01
+        self.assertIsNotNone(find_snapshot_page('01'))
+        self.assertIsNone(find_snapshot_page('../01'))
+
+        response = self.client.get(reverse('medication_list'), {'chapter': '01'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Alpha snapshot product', gzip.decompress(response.content))
+
+        bump_data_version()
+        response = self.client.get(reverse('medication_list'))
+        self.assertNotIn('X-Dashboard-Snapshot', response)  # Stale snapshot: rendered live
+        self.assertContains(response, 'Alpha snapshot product')
+
+
+# --- Portfolio spend calculator (user-035) ---
+class ParsePortfolioTests(SimpleTestCase):
+    def test_csv_and_json_give_the_same_lines(self):
+        from_csv = parse_portfolio(b"NPC_Code, Quantity\nA1, 10\nA2,2.5\n")
+        from_json = parse_portfolio('[{"npc_code": "A1", "quantity": 10}, {"npc_code": " A2", "quantity": "2.5"}]', fmt='json')
+        self.assertEqual(from_csv.values.tolist(), [['A1', 10.0], ['A2', 2.5]])
+        self.assertEqual(from_json.values.tolist(), from_csv.values.tolist())
+
+    def test_malformed_input_raises_value_error(self):
+        for data, fmt, message in (
+            ('[1, 2]', 'json', 'line 1 is not an object'),
+            ('[{"npc_code": ["A1"], "quantity": 1}]', 'json', 'npc_code must be a string'),
+            ('[{"npc_code": 123, "quantity": 1}]', 'json', 'npc_code must be a string'),
+            ('{"lines": []}', 'json', 'must be a list'),
+            ('[{"npc_code": "A1", "quantity": "lots"}]', 'json', 'non-numeric quantity'),
+            ('npc_code\nA1\n', 'csv', 'missing column(s): quantity'),
+        ):
+            with self.subTest(data=data), self.assertRaisesMessage(ValueError, message):
+                parse_portfolio(data, fmt=fmt)
+        with self.assertRaisesMessage(ValueError, 'mapping NPC code'):
+            parse_substitutions('{"A1": ["A2"]}')
+
+
+class PricePortfolioTests(TestCase):
+    def setUp(self):
+        seed_prices('A1', [4, 5])
+        seed_prices('A2', [2])
+        MedicationProduct.objects.create(npc_code='A3', product_name='Unpriced')
+
+    def test_spend_uses_latest_prices_and_applies_priced_substitutions(self):
+        lines = parse_portfolio('npc_code,quantity\nA1,10\nA3,1\nZZ,1\nA1,1\n')
+        df, totals = price_portfolio(lines, parse_substitutions({'A1': 'A2', 'A3': 'A1'}))
+        self.assertEqual(df['status'].tolist(), ['ok', 'no_price', 'unknown_code', 'ok'])
+        self.assertEqual(df['current_spend_gbp'].tolist()[0], 50.0)
+        self.assertEqual(
+            {key: totals[key] for key in ('current_spend_gbp', 'scenario_spend_gbp', 'delta_gbp', 'substituted_lines')},
+            {'current_spend_gbp': 55.0, 'scenario_spend_gbp': 22.0, 'delta_gbp': -33.0, 'substituted_lines': 2},
+        )
+
+
+class PortfolioApiTests(TestCase):
+    def post_json(self, payload):
+        return self.client.post(reverse('portfolio_api'), data=json.dumps(payload), content_type='application/json')
+
+    def test_malformed_lines_are_a_client_error(self):
+        for payload in ({'lines': [1, 2]}, {'lines': [{'npc_code': {'a': 1}, 'quantity': 1}]}, [1],
+                        {'lines': [{'npc_code': 'A1', 'quantity': 1}], 'source': ['x']}):
+            with self.subTest(payload=payload):
+                response = self.post_json(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_prices_a_json_portfolio(self):
+        seed_prices('A1', [3])
+        response = self.post_json({'lines': [{'npc_code': 'A1', 'quantity': 4}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['totals']['current_spend_gbp'], 12.0)
+
+
+# --- Dry-run diffs (user-036) ---
+class PricingDiffTests(TestCase):
+    def test_dry_run_reports_the_import_and_writes_nothing(self):
+        seed_prices('A1', [4], name='Alpha')
+        path = emit_csv(self, [['A1', 'Alpha', 5, 10, 0], ['A2', 'Beta', 2, 1, 0], ['A3', 'Gamma', None, 1, 0]])
+        out = io.StringIO()
+        call_command('import_emit_data', file=path, dry_run=True, stdout=out)
+        output = out.getvalue()
+        self.assertIn('Placeholder chemicals: 1 to insert, 0 to update', output)
+        self.assertIn('Medication products: 1 to insert, 1 to update, 0 to delete, 0 unchanged', output)
+        self.assertIn('Pricing history: 2 to insert', output)
+        self.assertIn('Dry run: nothing was written.', output)
+        self.assertEqual(MedicationProduct.objects.count(), 1)
+        self.assertEqual(MedicationPricingHistory.objects.count(), 1)
+
+    def test_repeated_period_is_flagged_as_duplicate(self):
+        prepared = pd.DataFrame({
+            'npc_code': ['A1'], 'product_name': ['Alpha'], 'price_gbp': [4.0], 'usage_estimate': [None],
+            'period_start': [date(2021, 7, 1)], 'period_end': [date(2022, 6, 30)],
+        })
+        seed_prices('A1', [4], name='Alpha')
+        MedicationProduct.objects.filter(npc_code='A1').update(latest_average_price_gbp=4)
+        products, prices = diff_pricing_import(prepared, source='eMIT Hospital Data')[2:]
+        self.assertEqual((products['unchanged'], products['updates']), (1, 0))
+        self.assertEqual(prices['duplicates_existing'], 1)
+
+
+class BNFDiffTests(TestCase):
+    def test_diff_counts_versions_reconciliation_and_purge(self):
+        apply_versioned_import(bnf_frame([
+            ('0101010A0AAAAAA', 'Alpha 5mg', 'Dyspepsia'),
+            ('0101010B0AAAAAA', 'Beta 5mg', 'Dyspepsia'),
+            ('0101010C0AAAAAA', 'Gamma 5mg', 'Dyspepsia'),
+        ], valid_from=date(2025, 4, 1)))
+        chemical = ChemicalComposition.objects.create(chemical_name='CHEM_NPC_N1')
+        placeholder = BNFHierarchy.objects.create(bnf_code_15digit='BNF_NPC_N1', bnf_chemical_substance='CHEM_NPC_N1')
+        MedicationProduct.objects.create(npc_code='N1', product_name='DELTA 5MG', bnf_code_15digit=placeholder, chemical_name=chemical)
+
+        release = bnf_frame([
+            ('0101010A0AAAAAA', 'Alpha 5mg', 'Dyspepsia'),
+            ('0101010B0AAAAAA', 'Beta 5mg', 'Antacids'),
+            ('0101010D0AAAAAA', 'Delta 5mg', 'Dyspepsia'),
+        ])
+        diffs = {diff['table']: diff for diff in diff_bnf_import(release, purge_placeholders=True)}
+        hierarchy = diffs['BNF hierarchy (versions)']
+        self.assertEqual(
+            {key: hierarchy[key] for key in ('inserts', 'updates', 'unchanged', 'deletes')},
+            {'inserts': 1, 'updates': 1, 'unchanged': 1, 'deletes': 1},
+        )
+        self.assertEqual(hierarchy['changed_fields'], {'bnf_section_name': 1})
+        reconciliation = diffs['Product reconciliation']
+        self.assertEqual(reconciliation['updates'], 1)
+        self.assertEqual(reconciliation['samples']['updates'][0]['changes']['bnf_code_15digit'], ('BNF_NPC_N1', '0101010D0AAAAAA'))
+        self.assertEqual(diffs['Placeholder BNF entries (purge)']['deletes'], 1)
+        self.assertEqual(diffs['Placeholder chemicals (purge)']['deletes'], 1)
+        self.assertEqual(diff_bnf_import(release, retire_missing=False)[1]['deletes'], 0)
+        self.assertFalse(BNFHierarchy.objects.filter(pk='0101010D0AAAAAA').exists())
+
+
+# --- Reference cache (user-037) ---
+@override_settings(ANALYTICS_SNAPSHOT_ON_IMPORT=False, DASHBOARD_SNAPSHOT_ON_IMPORT=False)
+class ReferenceCacheTests(TestCase):
+    def setUp(self):
+        invalidate_reference_cache()
+        self.addCleanup(invalidate_reference_cache)
+
+    def test_lookups_and_reload_on_data_version_bump(self):
+        apply_versioned_import(bnf_frame([('0101010A0AAAAAA', 'Alpha 5mg Tablets', 'Dyspepsia')]))
+        product = MedicationProduct.objects.create(npc_code='A1', product_name='Alpha')
+        references = get_reference_cache()
+        self.assertEqual(references.product_id('A1'), product.id)
+        self.assertEqual(references.bnf_code_for_presentation('ALPHA 5MG tablets'), '0101010A0AAAAAA')
+        self.assertEqual(references.full_classification('0101010A0AAAAAA'), 'Chapter 01 > Dyspepsia > Paragraph')
+        self.assertIsNone(references.product_id('ZZ'))
+
+        MedicationProduct.objects.create(npc_code='A2', product_name='Beta')
+        self.assertIs(get_reference_cache(), references)  # Same data version: the loaded copy is trusted
+        bump_data_version()
+        with mock.patch('medications.reference_cache.CHECK_INTERVAL', 0):
+            self.assertIsNotNone(get_reference_cache().product_id('A2'))
+
+    def test_pricing_writer_resolves_ids_across_chunks(self):
+        path = emit_csv(self, [['A1', 'Alpha', 2, 1, 0], ['A2', 'Beta', 3, 1, 0], ['A1', 'Alpha', 4, 1, 0]])
+        with mock.patch('medications.sources.emit.EmitAdapter.chunk_size', 1):
+            call_command('import_emit_data', file=path, stdout=io.StringIO())
+        a1 = MedicationProduct.objects.get(npc_code='A1')
+        self.assertEqual(MedicationProduct.objects.count(), 2)
+        self.assertEqual(sorted(a1.pricing_history.values_list('price_gbp', flat=True)), [2, 4])
+
+    def test_pricing_import_loads_the_cache_once_before_its_transaction(self):
+        seed_prices('A0', [1])
+        path = emit_csv(self, [['A0', 'Known', 2, 1, 0], ['N1', 'New', 3, 1, 0], ['N2', 'Newer', 4, 1, 0]])
+        loads = reference_cache_stats()['loads']
+        with mock.patch('medications.sources.emit.EmitAdapter.chunk_size', 1):
+            call_command('import_emit_data', file=path, stdout=io.StringIO())
+        self.assertEqual(reference_cache_stats()['loads'], loads + 1)  # Not reloaded for the new products
+        self.assertEqual(MedicationProduct.objects.get(npc_code='A0').pricing_history.count(), 2)
+        self.assertEqual(MedicationPricingHistory.objects.filter(product__npc_code__in=['N1', 'N2']).count(), 2)
+
+
+# --- Source adapters and the import pipeline (user-038) ---
+@override_settings(ANALYTICS_SNAPSHOT_ON_IMPORT=False, DASHBOARD_SNAPSHOT_ON_IMPORT=False)
+class ImportProgressTests(TestCase):
+    def test_csv_import_reports_a_total_up_front(self):
+        path = emit_csv(self, [['A1', 'Alpha', 2.5, 10, 0.1], ['A2', 'Beta', 1, 5, 0], ['A3', 'Gamma', None, 1, 0]])
+        totals = []
+        progress = lambda processed, total=None, stage=None: totals.append(total)
+        call_command('import_emit_data', file=path, progress=progress, stdout=io.StringIO())
+        self.assertEqual(totals[0], 3)
+
+    def test_job_progress_has_a_total_and_percent(self):
+        path = emit_csv(self, [['A1', 'Alpha', 2.5, 10, 0.1], ['A2', 'Beta', 1, 5, 0]])
+        reporter = ProgressReporter()
+        call_command('import_emit_data', file=path, progress=reporter, stdout=io.StringIO())
+        state = reporter.snapshot()
+        self.assertEqual((state['processed_rows'], state['total_rows']), (2, 2))
+        job = ImportJob(source='emit', status=ImportJob.STATUS_SUCCEEDED, **state)
+        self.assertEqual(job.progress_percent, 100.0)
+
+    def test_spreadsheet_total_is_known_after_loading(self):
+        from .sources.registry import get_adapter
+
+        adapter = get_adapter('emit', path=emit_csv(self, []).replace('.csv', '.ods'))
+        frame = pd.DataFrame([['A1', 'Alpha', 2.5, 10, 0.1]] * 7, columns=EMIT_HEADER)
+        with mock.patch('pathlib.Path.exists', return_value=True), \
+                mock.patch('pandas.read_excel', return_value=frame):
+            chunks = adapter.fetch()
+            self.assertIsNone(adapter.total_rows())
+            next(chunks)
+        self.assertEqual(adapter.total_rows(), 7)
+
+
+class SourceKeyAndColumnTests(TestCase):
+    def adapter(self, **attributes):
+        from .sources.emit import EmitAdapter
+
+        adapter_class = type('TestPricingAdapter', (EmitAdapter,), attributes)
+        return adapter_class(path=emit_csv(self, [['A1', 'Alpha', 2.5, 10, 0.1]]))
+
+    def test_writer_columns_missing_from_the_source_are_a_source_error(self):
+        from .sources.emit import EmitAdapter
+
+        column_map = {raw: field for raw, field in EmitAdapter.column_map.items() if field != 'product_name'}
+        with self.assertRaisesMessage(SourceError, 'missing column(s) for product_name'):
+            run_import(self.adapter(column_map=column_map))
+
+    def test_pricing_key_must_be_one_unique_product_field(self):
+        for key_fields in (('product_name',), ('npc_code', 'product_name'), ('no_such_field',)):
+            with self.subTest(key_fields=key_fields), self.assertRaisesMessage(SourceError, 'keyed on one unique'):
+                run_import(self.adapter(key_fields=key_fields), dry_run=True)
+        self.assertFalse(MedicationProduct.objects.exists())
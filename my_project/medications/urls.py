@@ -4,4 +4,11 @@ from . import views
 
 urlpatterns = [
     path("", views.medication_list, name="medication_list"),
+    path("price-changes/", views.price_changes, name="price_changes"),
+    path("api/price-changes/", views.price_changes_api, name="price_changes_api"),
+    path("api/portfolio/", views.portfolio_api, name="portfolio_api"),
+    path("api/db-stats/", views.database_stats_api, name="database_stats_api"),
+    path("api/reference-cache/", views.reference_cache_api, name="reference_cache_api"),
+    path("api/import-jobs/", views.import_jobs_api, name="import_jobs_api"),
+    path("api/import-jobs/<int:job_id>/", views.import_job_api, name="import_job_api"),
 ]
\ No newline at end of file
@@ -1,40 +1,168 @@
 # medications/views.py
 
-from django.shortcuts import render
-from .models import MedicationProduct, MedicationPricingHistory, BNFHierarchy
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .models import ImportJob
+from .jobs import with_live_progress
+from my_project.db_router import PRIMARY_DB_ALIAS, get_database_stats
+from .dashboard import dashboard_page_context, find_snapshot_page
+from .portfolio import parse_portfolio, parse_substitutions, portfolio_report
+from .reference_cache import reference_cache_stats
+from .pricing_trends import DEFAULT_SOURCE, DEFAULT_TOP_N, DEFAULT_WINDOW, get_price_change_report
+
+MAX_TOP_N = 200
+
+def _accepted_encodings(request):
+    """Content codings the client accepts, ignoring any listed with q=0."""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _dashboard_snapshot_response(request, chapter, page_number):
+    """Serves a pre-rendered dashboard page (precompressed when possible), or None to render live."""
+    found = find_snapshot_page(chapter, page_number)
+    if found is None:
+        return None
+    version, path = found
+    accepted = _accepted_encodings(request)
+    for coding, suffix in (('br', '.br'), ('gzip', '.gz'), (None, '')):
+        if coding is not None and coding not in accepted:
+            continue
+        try:
+            content = path.with_name(path.name + suffix).read_bytes()
+        except FileNotFoundError:
+            continue  # No .br without brotli, or the snapshot was pruned meanwhile
+        response = HttpResponse(content, content_type='text/html; charset=utf-8')
+        if coding:
+            response['Content-Encoding'] = coding
+        response['X-Dashboard-Snapshot'] = f"v{version}"
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+    return None
+
 
 def medication_list(request):
-    # Fetch all MedicationProducts
-    # Use select_related to fetch related BNFHierarchy and ChemicalComposition in one query
-    medications = MedicationProduct.objects.select_related(
-        'bnf_code_15digit', # Related BNFHierarchy object
-        'chemical_name'     # Related ChemicalComposition object
-    ).all()
-
-    # Prepare data for the template
-    medication_data = []
-    for med in medications:
-        # Get latest price from pricing history (assuming ordering by -period_start)
-        latest_price_obj = med.pricing_history.filter(source='eMIT Hospital Data').first()
-        latest_price = latest_price_obj.price_gbp if latest_price_obj else 'N/A'
-
-        # Get BNF Full Classification (using the @property from BNFHierarchy model)
-        bnf_full_classification = med.bnf_code_15digit.full_classification if med.bnf_code_15digit else 'N/A'
-
-        medication_data.append({
-            'product_id': med.id,
-            'product_name': med.product_name,
-            'npc_code': med.npc_code,
-            'bnf_code_15digit': med.bnf_code_15digit.bnf_code_15digit if med.bnf_code_15digit else 'N/A',
-            'bnf_chapter_name': med.bnf_code_15digit.bnf_chapter_name if med.bnf_code_15digit else 'N/A',
-            'bnf_chemical_substance': med.chemical_name.chemical_name if med.chemical_name else 'N/A',
-            'bnf_full_classification': bnf_full_classification, # Derived property
-            'latest_average_price_gbp': latest_price,
-            'annual_usage_estimate_items': med.annual_usage_estimate_items, # Derived property
-            'price_source': 'eMIT Hospital Data' if latest_price_obj else 'N/A',
-        })
-
-    context = {
-        'medications': medication_data
+    chapter = request.GET.get('chapter') or None
+    try:
+        page_number = int(request.GET.get('page', 1))
+    except ValueError:
+        page_number = 1
+    response = _dashboard_snapshot_response(request, chapter, page_number)
+    if response is None:
+        response = render(request, 'medications/medication_list.html', dashboard_page_context(chapter, page_number))
+    return response
+
+
+def _price_change_params(request):
+    # Clamp user-supplied sizes so a single request can't ask for the whole catalogue
+    try:
+        top_n = min(max(int(request.GET.get('top', DEFAULT_TOP_N)), 1), MAX_TOP_N)
+    except ValueError:
+        top_n = DEFAULT_TOP_N
+    try:
+        window = min(max(int(request.GET.get('window', DEFAULT_WINDOW)), 2), 24)
+    except ValueError:
+        window = DEFAULT_WINDOW
+    return {'top_n': top_n, 'window': window}
+
+
+def price_changes(request):
+    report = get_price_change_report(**_price_change_params(request))
+    return render(request, 'medications/price_changes.html', {'report': report})
+
+
+def price_changes_api(request):
+    return JsonResponse(get_price_change_report(**_price_change_params(request)))
+
+
+def _portfolio_format(name):
+    return 'json' if name.lower().endswith('.json') else 'csv'
+
+
+def _read_portfolio_request(request):
+    """Extracts (lines, substitutions, source) from a JSON, CSV or multipart upload request."""
+    if request.content_type == 'application/json':
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            raise ValueError("Expected a JSON object with \"lines\" and optional \"substitutions\".")
+        lines = parse_portfolio(payload.get('lines'), fmt='json')
+        substitutions = parse_substitutions(payload.get('substitutions') or {}, fmt='json')
+        source = payload.get('source') or DEFAULT_SOURCE
+        if not isinstance(source, str):
+            raise ValueError("\"source\" must be a string.")
+    elif request.content_type == 'multipart/form-data':
+        upload = request.FILES.get('portfolio')
+        if upload is None:
+            raise ValueError("Upload the portfolio as a file field named \"portfolio\".")
+        lines = parse_portfolio(upload.read(), fmt=_portfolio_format(upload.name))
+        upload = request.FILES.get('substitutions')
+        substitutions = parse_substitutions(upload.read(), fmt=_portfolio_format(upload.name)) if upload else None
+        source = request.POST.get('source') or DEFAULT_SOURCE
+    else:
+        lines = parse_portfolio(request.body, fmt='csv')
+        substitutions = None
+        source = request.GET.get('source') or DEFAULT_SOURCE
+    return lines, substitutions, source
+
+
+@csrf_exempt  # Stateless calculation for API clients; it reads prices and writes nothing
+@require_POST
+def portfolio_api(request):
+    try:
+        lines, substitutions, source = _read_portfolio_request(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(portfolio_report(lines, substitutions, source=source))
+
+
+@staff_member_required
+def database_stats_api(request):
+    return JsonResponse(get_database_stats())
+
+
+@staff_member_required
+def reference_cache_api(request):
+    return JsonResponse(reference_cache_stats())
+
+
+def _import_job_status(job):
+    job = with_live_progress(job)
+    return {
+        'id': job.pk,
+        'source': job.source,
+        'status': job.status,
+        'stage': job.stage,
+        'processed_rows': job.processed_rows,
+        'total_rows': job.total_rows,
+        'progress_percent': job.progress_percent,
+        'rows_per_second': job.throughput,
+        'eta_seconds': job.eta_seconds,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'error': job.error,
     }
-    return render(request, 'medications/medication_list.html', context)
\ No newline at end of file
+
+
+@staff_member_required
+def import_jobs_api(request):
+    jobs = ImportJob.objects.using(PRIMARY_DB_ALIAS).all()[:20]
+    return JsonResponse({'jobs': [_import_job_status(job) for job in jobs]})
+
+
+@staff_member_required
+def import_job_api(request, job_id):
+    # Progress changes every second, so always read it from the primary
+    job = get_object_or_404(ImportJob.objects.using(PRIMARY_DB_ALIAS), pk=job_id)
+    return JsonResponse(_import_job_status(job))
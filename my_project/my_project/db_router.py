@@ -0,0 +1,126 @@
+# my_project/db_router.py
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+PRIMARY_DB_ALIAS = 'default'
+
+# Apps whose reads must never lag behind writes (logins, sessions, permissions, admin log)
+PRIMARY_ONLY_APPS = {'admin', 'auth', 'contenttypes', 'sessions'}
+
+# When set, reads in this context go to the primary too (imports, admin, anything that writes)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+# Per-alias counters for this process, read by get_database_stats()
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: defaultdict(float))
+
+
+def _record(alias, key, amount=1):
+    with _stats_lock:
+        _stats[alias][key] += amount
+
+
+@contextmanager
+def use_primary():
+    """Routes every query inside the block to the primary database (read-your-writes)."""
+    token = _pinned_to_primary.set(True)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def read_replica_alias():
+    """The configured replica alias, or None when no replica is set up."""
+    alias = getattr(settings, 'DATABASE_READ_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+class PrimaryReplicaRouter:
+    """Sends writes (and pinned reads) to the primary and all other reads to the read replica."""
+
+    def db_for_read(self, model, **hints):
+        alias = read_replica_alias()
+        if alias is None or _pinned_to_primary.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            alias = PRIMARY_DB_ALIAS
+        _record(alias, 'reads_routed')
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _record(PRIMARY_DB_ALIAS, 'writes_routed')
+        return PRIMARY_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary, so relations across them are fine
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Schema and data migrations run on the primary only; a replica gets them by replication
+        return db == PRIMARY_DB_ALIAS
+
+
+class PrimaryPinningMiddleware:
+    """Pins admin pages and every non-safe request to the primary database."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') or request.path.startswith('/admin/'):
+            with use_primary():
+                return self.get_response(request)
+        return self.get_response(request)
+
+
+# --- Connection statistics ---
+def _count_queries(alias):
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _record(alias, 'queries')
+            _record(alias, 'query_time_ms', (time.perf_counter() - start) * 1000)
+    wrapper.is_db_stats_wrapper = True
+    return wrapper
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _record(connection.alias, 'connections_opened')
+    # The wrapper list lives on the DatabaseWrapper and survives reconnects, so install it once
+    if not any(getattr(w, 'is_db_stats_wrapper', False) for w in connection.execute_wrappers):
+        connection.execute_wrappers.append(_count_queries(connection.alias))
+
+
+connection_created.connect(_on_connection_created, dispatch_uid='my_project.db_router.stats')
+
+
+def get_database_stats():
+    """Per-alias routing, connection and query counters for this process, plus pool settings."""
+    stats = {}
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        with _stats_lock:
+            counters = dict(_stats.get(alias, {}))
+        stats[alias] = {
+            'vendor': connection.vendor,
+            'role': 'primary' if alias == PRIMARY_DB_ALIAS else ('replica' if alias == read_replica_alias() else 'other'),
+            'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+            'conn_health_checks': connection.settings_dict.get('CONN_HEALTH_CHECKS'),
+            'pooled': bool(connection.settings_dict.get('OPTIONS', {}).get('pool')),
+            'connected': connection.connection is not None,
+            'connections_opened': int(counters.get('connections_opened', 0)),
+            'reads_routed': int(counters.get('reads_routed', 0)),
+            'writes_routed': int(counters.get('writes_routed', 0)),
+            'queries': int(counters.get('queries', 0)),
+            'query_time_ms': round(counters.get('query_time_ms', 0.0), 2),
+        }
+    return stats
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'my_project.db_router.PrimaryPinningMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -76,16 +78,67 @@ WSGI_APPLICATION = 'my_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql', # Change to postgresql
-        'NAME': 'my_django_db',                     # Your database name
-        'USER': 'myuser',                           # Your database username
-        'PASSWORD': 'Irinalee88',         # Your database password
-        'HOST': 'localhost',                        # Or your database server IP/hostname
-        'PORT': '5432',                             # Default PostgreSQL port
+# 'default' is the primary: imports, admin and every write go there. Dashboard/API reads go to
+# DATABASE_READ_REPLICA_ALIAS when that alias is configured, otherwise to the primary as well.
+#   DB_ENGINE=sqlite      local testing: db.sqlite3 only (no replica; nothing would keep a second file in sync)
+#   DB_REPLICA_HOST=...   add a PostgreSQL read replica (DB_REPLICA_PORT / DB_REPLICA_NAME optional)
+#   DB_POOL=1             use psycopg's connection pool instead of persistent connections
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+DB_POOL = os.environ.get('DB_POOL') == '1'
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql', # Change to postgresql
+            'NAME': 'my_django_db',                     # Your database name
+            'USER': 'myuser',                           # Your database username
+            'PASSWORD': 'Irinalee88',         # Your database password
+            'HOST': 'localhost',                        # Or your database server IP/hostname
+            'PORT': '5432',                             # Default PostgreSQL port
+        }
     }
-}
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+            'HOST': os.environ['DB_REPLICA_HOST'],
+            'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        }
+
+for _alias, _db in DATABASES.items():
+    if DB_POOL and _db['ENGINE'] == 'django.db.backends.postgresql':
+        # Pooling and CONN_MAX_AGE are mutually exclusive; the pool checks connections on checkout
+        from psycopg_pool import ConnectionPool
+        _db['CONN_MAX_AGE'] = 0
+        _db['OPTIONS'] = {'pool': {'min_size': 2, 'max_size': 10, 'timeout': 10, 'check': ConnectionPool.check_connection}}
+    else:
+        # Persistent connections, verified before reuse at the start of each request
+        _db['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+        _db['CONN_HEALTH_CHECKS'] = True
+    if _alias != 'default':
+        _db['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['my_project.db_router.PrimaryReplicaRouter']
+DATABASE_READ_REPLICA_ALIAS = 'replica'
+
+
+# Analytics snapshots (medications/analytics.py, needs pyarrow)
+# A partitioned Parquet copy of the joined dataset, rewritten after every successful import.
+ANALYTICS_SNAPSHOT_DIR = BASE_DIR.parent / 'analytics'
+ANALYTICS_SNAPSHOT_ON_IMPORT = True
+
+# Static dashboard snapshots (medications/dashboard.py, brotli optional)
+# Every medication_list page pre-rendered to HTML (+ .gz/.br) after each import and served while current.
+DASHBOARD_SNAPSHOT_DIR = BASE_DIR.parent / 'dashboard'
+DASHBOARD_SNAPSHOT_ON_IMPORT = True
 
 
 # Password validation